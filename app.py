@@ -1,9 +1,12 @@
 from src.agent.web.browser.config import BrowserConfig
 from src.inference.gemini import ChatGemini
 from src.agent.web import WebAgent
+from src.agent.web.runner import TaskRunner
 from dotenv import load_dotenv
+import asyncio
 import os
 import re
+import sys
 
 # Load environment variables from .env file
 load_dotenv()
@@ -19,19 +22,29 @@ llm = ChatGemini(model='gemini-2.5-flash-preview-04-17', api_key=google_api_key,
 
 config=BrowserConfig(browser='chrome',browser_instance_dir=None,user_data_dir=None,headless=False)
 
-# Initialize the Web Agent
-agent = WebAgent(
-    config=config,
-    instructions=[], # Add any specific instructions for the agent here
-    llm=llm,
-    verbose=True, # Set to True to see detailed agent logs
-    use_vision=True, # Set to True if your LLM supports vision and you want to use screenshots
-    max_iteration=100,
-    token_usage=True # Set to True to see token usage logs
-)
+# Guarded, the spawned extraction and worker processes import this module without running it
+if __name__ == '__main__':
+    # Initialize the Web Agent
+    agent = WebAgent(
+        config=config,
+        instructions=[], # Add any specific instructions for the agent here
+        llm=llm,
+        verbose=True, # Set to True to see detailed agent logs
+        use_vision=True, # Set to True if your LLM supports vision and you want to use screenshots, 'auto' sends them only when the element lists are not enough
+        max_iteration=100,
+        token_usage=True # Set to True to see token usage logs
+    )
 
-user_query = input('Enter your query: ')
-print("\n🚀 Starting Web Agent...")
-agent_response = agent.invoke(user_query)
-print("\n✅ Agent Finished. Final Output:")
-print(agent_response.get('output'))
\ No newline at end of file
+    # Batch mode: python app.py tasks.jsonl [results.jsonl] runs the tasks concurrently in one browser
+    if len(sys.argv) > 1:
+        runner = TaskRunner(agent_factory=lambda pool: WebAgent(config=config, llm=llm, use_vision=True, max_iteration=100, pool=pool), config=config, concurrency=4)
+        output_path = sys.argv[2] if len(sys.argv) > 2 else 'results.jsonl'
+        metrics = asyncio.run(runner.run_file(sys.argv[1], output_path))
+        print(f"\n✅ Batch Finished. Results written to {output_path}: {metrics}")
+        sys.exit(0)
+
+    user_query = input('Enter your query: ')
+    print("\n🚀 Starting Web Agent...")
+    agent_response = agent.invoke(user_query)
+    print("\n✅ Agent Finished. Final Output:")
+    print(agent_response.get('output'))
\ No newline at end of file
@@ -1,13 +1,17 @@
 # src/agent/web/__init__.py
 from src.agent.web.tools import (
     click_tool, goto_tool, type_tool, scroll_tool, wait_tool, back_tool,
-    key_tool, scrape_tool, download_tool, tab_tool, forward_tool,
+    key_tool, scrape_tool, fetch_tool, crawl_tool, download_tool, tab_tool, forward_tool,
     menu_tool, done_tool, human_tool # Import human_tool
 )
 from src.message import SystemMessage,HumanMessage,ImageMessage,AIMessage
 from src.agent.web.utils import read_markdown_file,extract_agent_data
 from src.agent.web.browser import Browser,BrowserConfig
+from src.agent.web.browser.pool import BrowserPool
 from src.agent.web.context import Context,ContextConfig
+from src.agent.web.dom.serializer import serialize_state
+from src.agent.web.context.cache import get_http_cache
+from src.agent.web.download import format_size
 from langgraph.graph import StateGraph,END,START
 from src.agent.web.state import AgentState
 from src.inference import BaseInference
@@ -15,6 +19,7 @@ from src.tool.registry import Registry
 from src.memory import BaseMemory
 from src.agent import BaseAgent
 from pydantic import BaseModel
+from typing import Literal
 from datetime import datetime
 from termcolor import colored
 from src.tool import Tool
@@ -29,11 +34,11 @@ main_tools=[
     click_tool,goto_tool,key_tool,download_tool,
     type_tool,scroll_tool,wait_tool,menu_tool,
     back_tool,tab_tool,done_tool,forward_tool,
-    scrape_tool, human_tool # Add human_tool here
+    scrape_tool, fetch_tool, crawl_tool, human_tool # Add human_tool here
 ]
 
 class WebAgent(BaseAgent):
-    def __init__(self,config:BrowserConfig=None,additional_tools:list[Tool]=[],instructions:list=[],memory:BaseMemory=None,llm:BaseInference=None,max_iteration:int=10,use_vision:bool=False,verbose:bool=False,token_usage:bool=False) -> None:
+    def __init__(self,config:BrowserConfig=None,additional_tools:list[Tool]=[],instructions:list=[],memory:BaseMemory=None,llm:BaseInference=None,max_iteration:int=10,use_vision:bool|Literal['auto']=False,verbose:bool=False,token_usage:bool=False,observation_token_budget:int|None=None,pool:BrowserPool=None) -> None:
         self.name='Web Agent'
         self.description='The Web Agent is designed to automate the process of gathering information from the internet, such as to navigate websites, perform searches, and retrieve data.'
         self.observation_prompt=read_markdown_file('./src/agent/web/prompt/observation.md')
@@ -42,10 +47,14 @@ class WebAgent(BaseAgent):
         self.answer_prompt=read_markdown_file('./src/agent/web/prompt/answer.md')
         self.instructions=self.format_instructions(instructions)
         self.registry=Registry(main_tools+additional_tools)
+        # With a pool each task leases a warm context instead of launching its own browser
+        self.pool=pool
         self.browser=Browser(config=config)
         self.context=Context(browser=self.browser)
         self.max_iteration=max_iteration
         self.token_usage=token_usage
+        # When set, the element lists are ranked by relevance to the task and cut to this many tokens
+        self.observation_token_budget=observation_token_budget
         self.structured_output=None
         self.use_vision=use_vision
         self.verbose=verbose
@@ -56,6 +65,10 @@ class WebAgent(BaseAgent):
         self.llm=llm
         self.graph=self.create_graph()
 
+    def download_progress(self,url:str,done:int,total:int|None):
+        progress=f'{format_size(done)} of {format_size(total)}' if total else format_size(done)
+        print(colored(f'Downloading {url}: {progress}',color='light_blue'))
+
     def format_instructions(self,instructions):
         return '\n'.join([f'{i+1}. {instruction}' for (i,instruction) in enumerate(instructions)])
 
@@ -104,14 +117,24 @@ class WebAgent(BaseAgent):
 
         # Get the current browser state only if not using Human Tool
         if action_name != 'Human Tool':
-            browser_state=await self.context.get_state(use_vision=self.use_vision)
+            use_vision=self.use_vision
+            if use_vision=='auto' and observation.startswith('Error'):
+                # A failed action always gets a screenshot, the element lists may not show why it failed
+                use_vision=True
+            browser_state=await self.context.get_state(use_vision=use_vision)
             image_obj=browser_state.screenshot
+            screenshot_unchanged=browser_state.screenshot_unchanged
             current_tab=browser_state.current_tab
             tabs_info = browser_state.tabs_to_string()
-            interactive_elements = browser_state.dom_state.interactive_elements_to_string()
-            informative_elements = browser_state.dom_state.informative_elements_to_string()
+            if self.observation_token_budget:
+                query=f'{state.get('input')} {thought or ''}'
+                interactive_elements,informative_elements=serialize_state(browser_state.dom_state,query=query,token_budget=self.observation_token_budget)
+            else:
+                interactive_elements = browser_state.dom_state.interactive_elements_to_string()
+                informative_elements = browser_state.dom_state.informative_elements_to_string()
         else: # If Human Tool was used, don't update browser state, just pass the human response
             image_obj = None
+            screenshot_unchanged = False
             # Keep previous tab/element info or set to a 'waiting' state
             current_tab_state = state.get('messages')[-1].content
             current_tab_match = re.search(r"Current Tab: (.*?)\n", current_tab_state)
@@ -141,7 +164,11 @@ class WebAgent(BaseAgent):
             'interactive_elements':interactive_elements,
             'informative_elements':informative_elements
         })
-        messages=[AIMessage(action_prompt),ImageMessage(text=observation_prompt,image_obj=image_obj) if self.use_vision and image_obj is not None else HumanMessage(observation_prompt)]
+        if screenshot_unchanged:
+            # The screen looks the same as in the last screenshot, which is sent again as is
+            observation_prompt=f'{observation_prompt}\nScreenshot: the screen is unchanged since the previous screenshot.'
+        mime_type=f'image/{self.context.config.screenshot_format}'
+        messages=[AIMessage(action_prompt),ImageMessage(text=observation_prompt,image_obj=image_obj,mime_type=mime_type) if self.use_vision and image_obj is not None else HumanMessage(observation_prompt)]
         return {**state,'messages':messages,'prev_observation':observation}
 
     async def answer(self,state:AgentState):
@@ -217,6 +244,10 @@ class WebAgent(BaseAgent):
 
     async def async_invoke(self, input: str, structured_output:BaseModel=None)->dict|BaseModel:
         self.iteration=0
+        if self.pool is not None:
+            self.context=await self.pool.lease()
+            self.browser=self.context.browser
+        self.context.downloads.on_progress=self.download_progress if self.verbose else None
         self.structured_output=structured_output
         tools_prompt=self.registry.tools_prompt()
         current_datetime=datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -243,13 +274,20 @@ class WebAgent(BaseAgent):
             'prev_observation': 'Initial state, no observation yet.' # Added prev_observation
         }
         self.start_time=datetime.now()
-        response=await self.graph.ainvoke(state,config={'recursion_limit':self.max_iteration})
-        await self.close()
+        try:
+            response=await self.graph.ainvoke(state,config={'recursion_limit':self.max_iteration})
+        finally:
+            await self.close()
         self.end_time=datetime.now()
         total_seconds=(self.end_time-self.start_time).total_seconds()
         if self.verbose and self.token_usage:
             print(f'Input Tokens: {self.llm.tokens.input} Output Tokens: {self.llm.tokens.output} Total Tokens: {self.llm.tokens.total}')
             print(f'Total Time Taken: {total_seconds} seconds Number of Steps: {self.iteration}')
+            if self.context.config.filter_requests:
+                print(self.context.request_filter.report())
+            if self.context.config.http_cache:
+                http_cache=get_http_cache(self.context.config.http_cache_dir,self.context.config.http_cache_size)
+                print(f'HTTP Cache: {http_cache.stats}')
         # Extract and store the key takeaways of the task performed by the agent
         if self.memory:
             self.memory.store(response.get('messages'))
@@ -276,15 +314,16 @@ class WebAgent(BaseAgent):
         return response
 
     async def close(self):
-        '''Close the browser and context followed by clean up'''
+        '''Close the browser and context followed by clean up, the agent can run another task afterwards'''
         try:
-            await self.context.close_session()
-            await self.browser.close_browser()
+            if self.pool is not None:
+                # The leased context goes back to the pool, which replaces it with a fresh one
+                await self.pool.release(self.context)
+            else:
+                await self.context.close_session()
+                await self.browser.close_browser()
         except Exception as e:
             print('Failed to finish clean up', e) # Added error printing
-        finally:
-            self.context=None
-            self.browser=None
 
     def stream(self, input:str):
         pass
\ No newline at end of file
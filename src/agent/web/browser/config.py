@@ -10,7 +10,21 @@ class BrowserConfig:
     browser:Literal['chrome','firefox','edge']='edge'
     user_data_dir:str=None
     timeout:int=60*1000
-    slow_mo:int=300
+    slow_mo:int=0
+
+@dataclass
+class PoolConfig:
+    size:int=2
+    # Contexts kept warm per browser, ready to be leased
+    contexts_per_browser:int=2
+    # A browser is recycled past this age in seconds, this memory in MB (needs psutil) or this many leases
+    max_age:float=30*60
+    max_rss:int|None=None
+    max_leases:int|None=None
+    # Seconds between the health checks of the idle browsers, None checks only on release
+    health_interval:float|None=30
+    # Seconds a lease waits for a warm context before failing, None waits as long as it takes
+    lease_timeout:float|None=120
 
 SECURITY_ARGS = [
 	'--disable-web-security',
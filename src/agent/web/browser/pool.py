@@ -0,0 +1,257 @@
+from src.agent.web.browser.config import BrowserConfig,PoolConfig
+from src.agent.web.context import Context,ContextConfig
+from playwright.async_api import async_playwright,Playwright
+from src.agent.web.browser import Browser
+from contextlib import asynccontextmanager
+from dataclasses import dataclass,field
+from asyncio import Queue,Lock,gather,create_task,sleep,wait_for,Task,CancelledError,TimeoutError
+from time import monotonic
+from os import getpid
+
+try:
+    import psutil
+except ImportError:
+    psutil=None
+
+@dataclass
+class PooledBrowser:
+    browser:Browser
+    launched_at:float
+    # Root processes of the browser, found by diffing the child processes around the launch (psutil only), their renderers are walked at each check
+    pids:set[int]=field(default_factory=set)
+    leases:int=0
+    active:int=0
+    retired:bool=False
+
+class BrowserPool:
+    '''Keeps warm browsers with pre-created contexts and leases the contexts to the agents, a released context is closed and replaced by a fresh one.'''
+    def __init__(self,config:BrowserConfig=None,pool_config:PoolConfig=None,context_config:ContextConfig=None):
+        self.config=config if config else BrowserConfig()
+        self.pool_config=pool_config if pool_config else PoolConfig()
+        self.context_config=context_config if context_config else ContextConfig()
+        if self.config.user_data_dir is not None or self.config.browser_instance_dir is not None:
+            raise Exception('BrowserPool does not support persistent contexts')
+        self.playwright:Playwright=None
+        self.browsers:list[PooledBrowser]=[]
+        self.owners:dict[Context,PooledBrowser]={}
+        # A failed launch or warm up puts its error in place of the context, so a waiting lease fails instead of hanging
+        self.warm:Queue[Context|Exception]=Queue()
+        self.launch_lock=Lock()
+        self.start_lock=Lock()
+        self.tasks:set[Task]=set()
+        self.monitor_task:Task=None
+        self.closing=False
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def start(self):
+        # Concurrent leases on a pool that is not started yet launch it once
+        async with self.start_lock:
+            if self.playwright is not None:
+                return None
+            self.closing=False
+            self.playwright=await async_playwright().start()
+            await gather(*[self.launch() for _ in range(self.pool_config.size)])
+            if self.pool_config.health_interval is not None:
+                self.monitor_task=create_task(self.monitor())
+
+    async def launch(self,contexts:int|None=None)->PooledBrowser|None:
+        '''Launch a browser and warm up its contexts, a failure puts one error per context in the queue'''
+        contexts=self.pool_config.contexts_per_browser if contexts is None else contexts
+        browser=Browser(config=self.config)
+        # The playwright driver is shared by all the browsers of the pool
+        browser.playwright=self.playwright
+        async with self.launch_lock:
+            before=self.get_child_pids()
+            try:
+                browser.playwright_browser=await browser.setup_browser(self.config.browser)
+            except Exception as e:
+                print('Failed to launch a browser',e)
+                for _ in range(contexts):
+                    self.warm.put_nowait(e)
+                return None
+            pids=self.get_root_pids(self.get_child_pids()-before)
+        pooled=PooledBrowser(browser=browser,launched_at=monotonic(),pids=pids)
+        self.browsers.append(pooled)
+        await gather(*[self.warm_up(pooled) for _ in range(contexts)])
+        return pooled
+
+    async def warm_up(self,pooled:PooledBrowser):
+        context=Context(browser=pooled.browser,config=self.context_config)
+        try:
+            await context.init_session()
+        except Exception as e:
+            print('Failed to warm up a context',e)
+            self.warm.put_nowait(e)
+            return None
+        self.owners[context]=pooled
+        self.warm.put_nowait(context)
+
+    def get_child_pids(self)->set[int]:
+        if psutil is None:
+            return set()
+        return {process.pid for process in psutil.Process(getpid()).children(recursive=True)}
+
+    def get_root_pids(self,pids:set[int])->set[int]:
+        '''The processes of the set whose parent is not in it'''
+        roots=set()
+        for pid in pids:
+            try:
+                if psutil.Process(pid).ppid() not in pids:
+                    roots.add(pid)
+            except psutil.Error:
+                continue
+        return roots
+
+    def get_rss(self,pooled:PooledBrowser)->int:
+        '''Resident memory of the browser processes in MB, the renderers started since the launch included'''
+        rss=0
+        for pid in pooled.pids:
+            try:
+                root=psutil.Process(pid)
+                processes=[root,*root.children(recursive=True)]
+            except psutil.Error:
+                continue
+            for process in processes:
+                try:
+                    rss+=process.memory_info().rss
+                except psutil.Error:
+                    continue
+        return rss//(1024*1024)
+
+    def is_healthy(self,pooled:PooledBrowser)->bool:
+        playwright_browser=pooled.browser.playwright_browser
+        return not pooled.retired and playwright_browser is not None and playwright_browser.is_connected()
+
+    def should_recycle(self,pooled:PooledBrowser)->bool:
+        config=self.pool_config
+        if not self.is_healthy(pooled):
+            return True
+        if monotonic()-pooled.launched_at>config.max_age:
+            return True
+        if config.max_leases is not None and pooled.leases>=config.max_leases:
+            return True
+        if config.max_rss is not None and psutil is not None and pooled.pids and self.get_rss(pooled)>config.max_rss:
+            return True
+        return False
+
+    async def lease(self)->Context:
+        '''Take a warm context, the contexts of unhealthy browsers are dropped on the way'''
+        await self.start()
+        while True:
+            try:
+                context=await wait_for(self.warm.get(),timeout=self.pool_config.lease_timeout)
+            except TimeoutError:
+                raise Exception(f'No browser context available after {self.pool_config.lease_timeout}s')
+            if isinstance(context,Exception):
+                # The slot is tried again in the background, this lease reports the failure
+                self.spawn(self.refill())
+                raise Exception(f'No browser context available: {context}')
+            pooled=self.owners.get(context)
+            if pooled is not None and self.is_healthy(pooled):
+                pooled.leases+=1
+                pooled.active+=1
+                return context
+            self.owners.pop(context,None)
+            if pooled is not None:
+                self.retire(pooled)
+
+    async def release(self,context:Context):
+        '''Close the leased context, its browser gets a fresh context in the background or is recycled'''
+        pooled=self.owners.pop(context,None)
+        await context.close_session()
+        if pooled is None:
+            return None
+        pooled.active-=1
+        if not pooled.retired and self.should_recycle(pooled):
+            pooled.retired=True
+        if not pooled.retired:
+            self.spawn(self.warm_up(pooled))
+        elif pooled.active==0:
+            self.spawn(self.replace(pooled))
+
+    def retire(self,pooled:PooledBrowser):
+        '''Stop leasing from the browser, it is replaced once its leased contexts are released'''
+        if pooled.retired:
+            return None
+        pooled.retired=True
+        if pooled.active==0:
+            self.spawn(self.replace(pooled))
+
+    async def replace(self,pooled:PooledBrowser):
+        if pooled not in self.browsers:
+            return None
+        self.browsers.remove(pooled)
+        # The warm contexts of the retired browser are dropped when they come out of the queue
+        try:
+            await pooled.browser.playwright_browser.close()
+        except Exception as e:
+            print('Browser failed to close',e)
+        if not self.closing:
+            await self.launch()
+
+    async def refill(self):
+        '''Warm up a context in place of a failed one, on a healthy browser or a new one'''
+        if self.closing:
+            return None
+        pooled=next((pooled for pooled in self.browsers if self.is_healthy(pooled)),None)
+        if pooled is not None:
+            await self.warm_up(pooled)
+        else:
+            # A single context, so a failing launch gives back one error and not one per context
+            await self.launch(contexts=1)
+
+    async def check_health(self):
+        '''Retire the idle browsers that are disconnected or past their limits'''
+        for pooled in list(self.browsers):
+            if pooled.active==0 and self.should_recycle(pooled):
+                self.retire(pooled)
+
+    async def monitor(self):
+        '''Run the health check periodically, the idle browsers are recycled without waiting for a release'''
+        try:
+            while not self.closing:
+                await sleep(self.pool_config.health_interval)
+                await self.check_health()
+        except CancelledError:
+            pass
+
+    def spawn(self,coroutine):
+        task=create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    @asynccontextmanager
+    async def session(self):
+        context=await self.lease()
+        try:
+            yield context
+        finally:
+            await self.release(context)
+
+    async def close(self):
+        self.closing=True
+        if self.monitor_task is not None:
+            self.monitor_task.cancel()
+            self.monitor_task=None
+        await gather(*list(self.tasks),return_exceptions=True)
+        while not self.warm.empty():
+            context=self.warm.get_nowait()
+            if isinstance(context,Exception):
+                continue
+            self.owners.pop(context,None)
+            await context.close_session()
+        for pooled in self.browsers:
+            try:
+                await pooled.browser.playwright_browser.close()
+            except Exception as e:
+                print('Browser failed to close',e)
+        self.browsers.clear()
+        if self.playwright is not None:
+            await self.playwright.stop()
+        self.playwright=None
@@ -1,23 +1,64 @@
-from playwright.async_api import Page,Browser as PlaywrightBrowser,Frame,ElementHandle,BrowserContext as PlaywrightContext
-from src.agent.web.context.config import IGNORED_URL_PATTERNS,RELEVANT_FILE_EXTENSIONS,RELEVANT_CONTEXT_TYPES
+from playwright.async_api import Page,Browser as PlaywrightBrowser,Frame,ElementHandle,Request,BrowserContext as PlaywrightContext,Error as PlaywrightError
+from src.agent.web.context.config import RELEVANT_FILE_EXTENSIONS,RELEVANT_CONTEXT_TYPES
 from src.agent.web.browser.config import BROWSER_ARGS,SECURITY_ARGS,IGNORE_DEFAULT_ARGS
 from src.agent.web.context.views import BrowserSession,BrowserState,Tab
 from src.agent.web.context.config import ContextConfig
-from src.agent.web.dom.views import DOMElementNode
+from src.agent.web.context.screenshot import load_screenshot,render_screenshot,get_difference
+from src.agent.web.context.network import RequestFilter,IGNORED_URL_MATCHER
+from src.agent.web.context.cache import get_http_cache
+from src.agent.web.context.session import SessionStore,RESTORED_KEY,get_session_storage_script,is_login_wall
+from src.agent.web.dom.views import DOMElementNode,DOMState
+from src.agent.web.dom.config import SHADOW_ROOT_STEP
 from src.agent.web.browser import Browser
-from src.agent.web.dom import DOM
+from src.agent.web.dom import DOM,get_dom_script
+from src.agent.web.dom.accessibility import AccessibilityDOM
+from src.agent.web.dom.snapshot import SnapshotDOM
+from src.agent.web.download import DownloadManager
+from src.agent.web.fetch import Fetcher,FetchResult
 from urllib.parse import urlparse
 from datetime import datetime
+from asyncio import gather,sleep,wait_for,to_thread
+from time import monotonic
 from pathlib import Path
+from typing import Literal
 from uuid import uuid4
 from os import getcwd
 
+# Walks from a shadow host down the relative xpaths of its nested shadow roots
+SHADOW_ROOT_SCRIPT='''(host,paths)=>{
+    let element=host;
+    for (const path of paths) {
+        if (!element || !element.shadowRoot) return null;
+        element=document.evaluate('.'+path,element.shadowRoot,null,XPathResult.FIRST_ORDERED_NODE_TYPE,null).singleNodeValue;
+    }
+    return element;
+}'''
+
 class Context:
     def __init__(self,browser:Browser,config:ContextConfig=ContextConfig()):
         self.browser=browser
         self.config=config
         self.context_id=str(uuid4())
         self.session:BrowserSession=None
+        # Element handles resolved during the current step, keyed by (frame xpath, agent id)
+        self.handles:dict[tuple[str,str],ElementHandle]={}
+        # Requests in flight per page with their start time, and the time of the last network activity of the page
+        self.requests:dict[Page,dict[Request,float]]={}
+        self.network_activity:dict[Page,float]={}
+        self.request_filter=RequestFilter(config)
+        self.downloads=DownloadManager()
+        self.fetcher=Fetcher(user_agent=config.user_agent,timeout=config.fast_fetch_timeout,ttl=config.fast_fetch_ttl)
+        self.sessions=SessionStore(config.sessions_dir,ttl=config.session_ttl)
+        # Whether this context started from a saved session, and whether the last page asked to log in
+        self.session_restored=False
+        self.login_wall=False
+        # Open tabs in opening order, kept current by the page events
+        self.tabs:dict[Page,Tab]={}
+        # Urls already read by the crawl tool in this context
+        self.visited:set[str]=set()
+        # Fingerprint and image of the last screenshot sent to the LLM
+        self.screenshot_fingerprint=None
+        self.screenshot_image:bytes|None=None
 
     async def __aenter__(self):
         await self.init_session()
@@ -30,11 +71,21 @@ class Context:
         if self.session is None:
             return None
         try:
+            await self.save_session()
+        except Exception as e:
+            print('Session failed to save',e)
+        try:
+            await self.downloads.close()
+            await self.fetcher.close()
             await self.session.context.close()
         except Exception as e:
             print('Context failed to close',e)
         finally:
-            self.browser_context=None
+            # A closed context starts a new session when used again
+            self.session=None
+            self.tabs.clear()
+            self.visited.clear()
+            self.screenshot_fingerprint=self.screenshot_image=None
 
     async def init_session(self):
         browser=await self.browser.get_playwright_browser()
@@ -51,21 +102,85 @@ class Context:
         self.session=BrowserSession(context,page,state)
         
     async def initial_state(self,page:Page):
-        screenshot,dom_state=None,[]
+        screenshot,dom_state=None,DOMState()
         current_tab=Tab(0,page.url,await page.title(),page)
         tabs=[]
         state=BrowserState(current_tab=current_tab,tabs=tabs,screenshot=screenshot,dom_state=dom_state)
         return state
     
-    async def update_state(self,use_vision:bool=False):
-        dom=DOM(self)
+    async def update_state(self,use_vision:bool|Literal['auto']=False):
+        await self.clear_handles()
+        dom=self.get_dom()
         screenshot,dom_state=await dom.get_state(use_vision=use_vision)
+        await self.check_login_wall(dom_state)
+        screenshot_unchanged=False
+        if screenshot is not None:
+            screenshot,screenshot_unchanged=await self.process_screenshot(screenshot,dom_state)
         tabs=await self.get_all_tabs()
         current_tab=await self.get_current_tab()
-        state=BrowserState(current_tab=current_tab,tabs=tabs,screenshot=screenshot,dom_state=dom_state)
+        state=BrowserState(current_tab=current_tab,tabs=tabs,screenshot=screenshot,dom_state=dom_state,screenshot_unchanged=screenshot_unchanged)
         return state
+
+    async def check_login_wall(self,dom_state:DOMState):
+        '''A login wall after restoring a session means the saved session no longer holds, so it is dropped'''
+        if self.config.session_name is None:
+            return None
+        page=await self.get_current_page()
+        try:
+            title=await page.title()
+        except PlaywrightError:
+            title=''
+        self.login_wall=is_login_wall(page.url,title,[node.attributes for node in dom_state.interactive_nodes])
+        if self.login_wall and self.session_restored:
+            self.sessions.invalidate(self.config.session_name)
+            self.session_restored=False
+
+    async def save_session(self):
+        '''Snapshot the session under its name, unless the last page asked to log in. A persistent context keeps its own profile.'''
+        if self.config.session_name is None or self.login_wall:
+            return None
+        context=self.session.context
+        if context.browser is None:
+            return None
+        try:
+            storage_state=await context.storage_state(indexed_db=True)
+        except TypeError:
+            # Playwright before 1.51 cannot snapshot IndexedDB
+            storage_state=await context.storage_state()
+        session_storage={}
+        script=f'()=>[location.origin,Object.entries(sessionStorage).filter(([key])=>key!=="{RESTORED_KEY}")]'
+        for page in context.pages:
+            try:
+                origin,items=await page.evaluate(script)
+            except PlaywrightError:
+                continue
+            if origin!='null' and items:
+                session_storage[origin]=items
+        self.sessions.save(self.config.session_name,storage_state,session_storage)
+
+    async def process_screenshot(self,screenshot:bytes,dom_state:DOMState)->tuple[bytes,bool]:
+        '''Annotate and encode the screenshot in a worker thread, the last image sent is returned again when the screen and its marks look the same.'''
+        boxes=[node.bounding_box for node in dom_state.interactive_nodes]
+        config=self.config
+        decoded,fingerprint=await to_thread(load_screenshot,screenshot,boxes)
+        threshold=config.screenshot_dedupe_threshold
+        if threshold is not None and self.screenshot_fingerprint is not None and get_difference(fingerprint,self.screenshot_fingerprint)<=threshold:
+            # Skips the resize, the marks and the encoding; the earlier images are dropped from the history, so the model still gets this one again
+            return self.screenshot_image,True
+        image=await to_thread(render_screenshot,decoded,boxes,format=config.screenshot_format,quality=config.screenshot_quality,max_width=config.screenshot_max_width)
+        self.screenshot_fingerprint=fingerprint
+        self.screenshot_image=image
+        return image,False
     
-    async def get_state(self,use_vision=False)->BrowserState:
+    def get_dom(self)->DOM:
+        '''The extraction engine selected in the config'''
+        if self.config.dom_engine=='snapshot':
+            return SnapshotDOM(self)
+        if self.config.dom_engine=='accessibility':
+            return AccessibilityDOM(self)
+        return DOM(self)
+
+    async def get_state(self,use_vision:bool|Literal['auto']=False)->BrowserState:
         session=await self.get_session()
         state=await self.update_state(use_vision=use_vision)
         session.state=state
@@ -76,6 +191,16 @@ class Context:
             await self.init_session()
         return self.session
     
+    async def fast_fetch(self,url:str,format:Literal['markdown','text']='markdown')->FetchResult|None:
+        '''The page over plain HTTP with the cookies of the session, None when it needs the browser'''
+        if not self.config.fast_fetch:
+            return None
+        session=await self.get_session()
+        # A logged-in session must read the page it would see in the browser, not the logged-out one
+        cookies=await session.context.cookies(url)
+        cookie='; '.join(f'{cookie.get("name")}={cookie.get("value")}' for cookie in cookies)
+        return await self.fetcher.fetch(url,format,cookie=cookie)
+
     async def get_current_page(self)->Page:
         session=await self.get_session()
         if session.current_page is None:
@@ -92,7 +217,14 @@ class Context:
             'no_viewport':True
         }
         if browser is not None:
+            snapshot=self.sessions.load(self.config.session_name) if self.config.session_name else None
+            if snapshot is not None:
+                parameters['storage_state']=snapshot.get('storage_state')
             context=await browser.new_context(**parameters)
+            if snapshot is not None:
+                self.session_restored=True
+                if snapshot.get('session_storage'):
+                    await context.add_init_script(get_session_storage_script(snapshot.get('session_storage')))
             with open('./src/agent/web/context/script.js') as f:
                 script=f.read()
             await context.add_init_script(script)
@@ -117,26 +249,133 @@ class Context:
                 context=await self.browser.playwright.chromium.launch_persistent_context(channel='msedge',**parameters)
             else:
                 raise Exception('Invalid Browser Type')
+        # Registered once per context, so the extraction script is present in every page and frame
+        await context.add_init_script(get_dom_script())
+        if self.config.http_cache:
+            http_cache=get_http_cache(self.config.http_cache_dir,self.config.http_cache_size)
+            # The routes run last registered first, so the filter sees the requests before the cache
+            await context.route('**/*',http_cache.handle)
+        if self.config.filter_requests:
+            # Routing disables the browser HTTP cache, the blocked requests more than make up for it on ad-heavy pages
+            await context.route('**/*',self.request_filter.handle)
+        self.track_network(context)
+        self.track_tabs(context)
         return context
-    
-    async def get_all_tabs(self)->list[Tab]:
-        session=await self.get_session()
-        pages=session.context.pages
-        tabs:list[Tab]=[]
-        for id,page in enumerate(pages):
-            await page.wait_for_load_state('domcontentloaded')
+
+    def track_tabs(self,context:PlaywrightContext):
+        '''Keep the tab registry current from the page events, so listing the tabs is an in-memory read'''
+        context.on('page',self.on_page)
+        # The pages opened with a persistent context are there before the listener
+        for page in context.pages:
+            self.on_page(page)
+
+    def on_page(self,page:Page):
+        # The ids are assigned when the tabs are listed
+        self.tabs[page]=Tab(id=len(self.tabs),url=page.url,title='',page=page)
+        page.once('close',self.on_page_close)
+        page.on('domcontentloaded',self.update_tab)
+        page.on('load',self.update_tab)
+        page.on('framenavigated',self.on_frame_navigated)
+
+    async def on_frame_navigated(self,frame:Frame):
+        if frame.parent_frame is None:
+            await self.update_tab(frame.page)
+
+    async def update_tab(self,page:Page):
+        tab=self.tabs.get(page)
+        if tab is None:
+            return None
+        tab.url=page.url
+        try:
+            tab.title=await page.title()
+        except PlaywrightError:
+            # The page navigated again or closed meanwhile, its next event updates the tab
+            pass
+
+    def track_network(self,context:PlaywrightContext):
+        '''Keep the requests in flight of every page, used by the readiness check'''
+        context.on('request',self.on_request)
+        context.on('requestfinished',self.on_request_done)
+        context.on('requestfailed',self.on_request_done)
+
+    def get_request_page(self,request:Request)->Page|None:
+        try:
+            return request.frame.page
+        except Exception:
+            # The requests of the service workers have no frame
+            return None
+
+    def on_request(self,request:Request):
+        page=self.get_request_page(request)
+        # The event streams stay open for the life of the page
+        if page is None or request.resource_type in ('eventsource','websocket'):
+            return None
+        now=monotonic()
+        self.requests.setdefault(page,{})[request]=now
+        self.network_activity[page]=now
+
+    def on_request_done(self,request:Request):
+        page=self.get_request_page(request)
+        if page is None or page not in self.requests:
+            return None
+        self.requests[page].pop(request,None)
+        self.network_activity[page]=monotonic()
+
+    def on_page_close(self,page:Page):
+        self.tabs.pop(page,None)
+        self.requests.pop(page,None)
+        self.network_activity.pop(page,None)
+
+    async def wait_for_network_idle(self,page:Page,timeout:float)->bool:
+        '''Wait until the page had no request in flight for the quiet time, the long-lived requests (polling, streams) are ignored'''
+        deadline=monotonic()+timeout
+        while True:
+            now=monotonic()
+            pending=[start for start in self.requests.get(page,{}).values() if now-start<self.config.long_request_time]
+            if not pending and now-self.network_activity.get(page,0)>=self.config.network_quiet_time:
+                return True
+            if now>=deadline:
+                return False
+            await sleep(min(0.05,deadline-now))
+
+    async def wait_for_page_idle(self,page:Page,timeout:float)->dict[str,bool]:
+        '''Wait in the page until the DOM stopped mutating, a frame was painted and the fonts are loaded'''
+        script='options=>waitForReady(options)'
+        options={'quietTime':self.config.dom_quiet_time*1000,'settleTime':self.config.dom_settle_time*1000,'timeout':timeout*1000}
+        try:
             try:
-                url=page.url
-                title=await page.title()
-            except Exception as e:
-                print(f'Tab failed to load: {e}')
-                continue
-            tabs.append(Tab(id=id,url=url,title=title,page=page))
-        return tabs
+                return await wait_for(self.execute_script(page,script,options),timeout=timeout+1)
+            except PlaywrightError as e:
+                if 'waitForReady is not defined' not in str(e):
+                    raise e
+            await self.execute_script(page,get_dom_script())
+            return await wait_for(self.execute_script(page,script,options),timeout=timeout+1)
+        except Exception:
+            # A navigation destroyed the execution context, the page is not ready
+            return {}
+
+    async def wait_for_ready(self,timeout:float|None=None)->dict[str,bool]:
+        '''Wait until the current page is ready to be observed: no request in flight, no DOM mutation, a painted frame and the fonts loaded, each bounded by the deadline'''
+        page=await self.get_current_page()
+        timeout=self.config.maximum_wait_page_load_time if timeout is None else timeout
+        network,page_state=await gather(self.wait_for_network_idle(page,timeout),self.wait_for_page_idle(page,timeout))
+        return {
+            'network':network,
+            'dom':page_state.get('dom',False),
+            'frame':page_state.get('frame',False),
+            'fonts':page_state.get('fonts',False)
+        }
     
+    async def get_all_tabs(self)->list[Tab]:
+        '''The open tabs, read from the registry kept by the page events'''
+        await self.get_session()
+        return [Tab(id=id,url=tab.url,title=tab.title,page=page) for id,(page,tab) in enumerate(self.tabs.items())]
+
     async def get_current_tab(self)->Tab:
-        tabs=await self.get_all_tabs()
         current_page=await self.get_current_page()
+        # Only the current tab is refreshed, its title may change without an event (e.g. single page apps)
+        await self.update_tab(current_page)
+        tabs=await self.get_all_tabs()
         return next((tab for tab in tabs if tab.page==current_page),None)
     
     async def get_selector_map(self)->dict[int,DOMElementNode]:
@@ -150,14 +389,45 @@ class Context:
         element=selector_map.get(index)
         return element
     
+    async def get_handle(self,element:DOMElementNode)->ElementHandle:
+        '''Resolve the handle of an element from the agent id stamped during extraction, the xpath is only a fallback'''
+        frame_xpath=element.xpath.get('frame')
+        key=(frame_xpath,element.agent_id)
+        if element.agent_id is not None and key in self.handles:
+            return self.handles[key]
+        handle=None
+        if element.agent_id is not None:
+            session=await self.get_session()
+            frame=session.state.dom_state.frames.get(frame_xpath)
+            if frame is not None and not frame.is_detached():
+                handle=await self.execute_script(frame,'id=>getAgentElement(id)',element.agent_id,enable_handle=True)
+        if handle is None and element.xpath.get('element'):
+            handle=await self.get_handle_by_xpath(element.xpath)
+        if handle is None:
+            raise Exception('Element not found in the page, it was re-rendered or removed: refresh the state before acting on it')
+        if element.agent_id is not None:
+            self.handles[key]=handle
+        return handle
+
+    async def clear_handles(self):
+        '''Release the handles cached in the previous step'''
+        handles=list(self.handles.values())
+        self.handles.clear()
+        await gather(*[handle.dispose() for handle in handles],return_exceptions=True)
+
     async def get_handle_by_xpath(self,xpath:dict[str,str])->ElementHandle:
         page=await self.get_current_page()
-        frame_xpath,element_xpath=xpath.values()
+        frame_xpath,element_xpath=xpath.get('frame'),xpath.get('element')
+        # The xpath of an element in a shadow tree goes through its hosts, the document xpath only reaches the first one
+        host_xpath,*shadow_paths=element_xpath.split(f'/{SHADOW_ROOT_STEP}')
         if frame_xpath: # handle elements from iframe
             frame=page.frame_locator(f'xpath={frame_xpath}')
-            element=await frame.locator(f'xpath={element_xpath}').element_handle()
+            element=await frame.locator(f'xpath={host_xpath}').element_handle()
         else: #handle elements from main frame
-            element=await page.locator(f'xpath={element_xpath}').element_handle()
+            element=await page.locator(f'xpath={host_xpath}').element_handle()
+        if shadow_paths and element is not None:
+            handle=await element.evaluate_handle(SHADOW_ROOT_SCRIPT,shadow_paths)
+            element=handle.as_element()
         return element
 
     async def execute_script(self,obj:Frame|Page,script:str,args:list=None,enable_handle:bool=False):
@@ -170,7 +440,7 @@ class Context:
         url_pattern=urlparse(url).netloc
         if not url_pattern:
             return True
-        return any(pattern in url_pattern for pattern in IGNORED_URL_PATTERNS)
+        return IGNORED_URL_MATCHER.search(url_pattern)
     
     async def is_frame_visible(self,frame:Frame)->bool:
         if frame.is_detached() or self.is_ad_url(frame.url):
@@ -200,8 +470,8 @@ class Context:
             path=folder_path.joinpath(f'screenshot_{date_time}.jpeg')
         else:
             path=None
-        await page.wait_for_timeout(2*1000)
-        screenshot=await page.screenshot(path=path,full_page=full_page,animations='disabled',type='jpeg')
+        # In CSS pixels, so the extracted boxes map onto the image as they are
+        screenshot=await page.screenshot(path=path,full_page=full_page,animations='disabled',type='jpeg',scale='css')
         return screenshot
     
     async def is_page_blank(self):
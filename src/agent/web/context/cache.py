@@ -0,0 +1,213 @@
+from playwright.async_api import Route,APIResponse
+from email.utils import parsedate_to_datetime
+from functools import cache
+from asyncio import to_thread
+from threading import Lock
+from pathlib import Path
+from hashlib import sha256
+from os import replace,getpid
+from time import time
+import sqlite3
+import json
+
+# Only the static resources, the documents and the API calls always go to the network
+CACHEABLE_TYPES = {'stylesheet','script','font','image'}
+# Headers of the original transfer, the cached body is stored decoded
+DROPPED_HEADERS = {'content-encoding','content-length','transfer-encoding','connection','keep-alive','set-cookie'}
+
+def parse_cache_control(value:str)->dict[str,str|None]:
+    directives={}
+    for part in value.split(','):
+        name,_,argument=part.strip().partition('=')
+        if name:
+            directives[name.lower()]=argument.strip('"') or None
+    return directives
+
+def parse_date(value:str|None)->float|None:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError,ValueError):
+        return None
+
+def get_vary(request_headers:dict[str,str],response_headers:dict[str,str])->dict[str,str]|None:
+    '''The request headers the response varies on with their values, None when it varies on everything'''
+    names={name.strip().lower() for name in response_headers.get('vary','').split(',') if name.strip()}
+    if '*' in names:
+        return None
+    # The body is stored decoded, so the encoding does not matter
+    names.discard('accept-encoding')
+    # An origin-specific CORS answer is only valid for that origin, even without Vary: Origin
+    allow_origin=response_headers.get('access-control-allow-origin','*').strip()
+    if allow_origin!='*':
+        names.add('origin')
+    return {name:request_headers.get(name,'') for name in sorted(names)}
+
+def get_key(url:str,request_headers:dict[str,str])->str:
+    '''The entries are kept per url and origin, a CORS response of one site is never replayed to another'''
+    return f'{request_headers.get("origin","")} {url}'
+
+def get_expiry(headers:dict[str,str],now:float)->float|None:
+    '''When the response stops being fresh (RFC 9111), None when it must not be stored'''
+    directives=parse_cache_control(headers.get('cache-control',''))
+    if 'no-store' in directives or 'private' in directives or headers.get('vary','').strip()=='*':
+        return None
+    if 'no-cache' in directives:
+        return now
+    # The age is the time the response already spent in other caches
+    age=int(headers.get('age')) if headers.get('age','').strip().isdigit() else 0
+    for directive in ('s-maxage','max-age'):
+        if directives.get(directive,'').isdigit():
+            return now+max(0,int(directives.get(directive))-age)
+    expires=parse_date(headers.get('expires'))
+    if expires is not None:
+        return expires
+    last_modified=parse_date(headers.get('last-modified'))
+    if last_modified is not None:
+        # Heuristic freshness: a tenth of the time since the last modification
+        date=parse_date(headers.get('date')) or now
+        return now+max(0,date-last_modified)/10
+    # Still worth keeping when it can be revalidated
+    return now if headers.get('etag') else None
+
+class HTTPCache:
+    '''Disk HTTP cache shared by the contexts of all the processes: the bodies are stored by their sha256 and a sqlite index keeps the entries, evicted least recently used first past the size cap.'''
+    def __init__(self,directory:str,max_size:int):
+        self.directory=Path(directory)
+        self.bodies=self.directory.joinpath('bodies')
+        self.bodies.mkdir(parents=True,exist_ok=True)
+        self.max_size=max_size*1024*1024
+        self.lock=Lock()
+        self.connection=sqlite3.connect(self.directory.joinpath('index.sqlite'),timeout=30,check_same_thread=False,isolation_level=None)
+        # WAL lets the other processes read while one writes
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS entries (
+            url TEXT PRIMARY KEY, hash TEXT, status INTEGER, headers TEXT, size INTEGER,
+            expires REAL, etag TEXT, last_modified TEXT, accessed REAL, vary TEXT)''')
+        try:
+            # The caches created before the entries were keyed by origin lack the column
+            self.connection.execute('ALTER TABLE entries ADD COLUMN vary TEXT')
+        except sqlite3.OperationalError:
+            pass
+        self.connection.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS entries_hash ON entries(hash)')
+        self.stats={'hits':0,'revalidated':0,'misses':0,'stored':0}
+        # Running total of the sizes, summed from the index only when it passes the cap since the other processes write too
+        self.total=self.connection.execute('SELECT COALESCE(SUM(size),0) FROM entries').fetchone()[0]
+
+    def get_body_path(self,hash:str)->Path:
+        return self.bodies.joinpath(hash[:2],hash)
+
+    def lookup(self,key:str,request_headers:dict[str,str])->dict|None:
+        with self.lock:
+            row=self.connection.execute('SELECT hash,status,headers,expires,etag,last_modified,vary FROM entries WHERE url=?',(key,)).fetchone()
+            if row is None:
+                return None
+            hash,status,headers,expires,etag,last_modified,vary=row
+            # Stored for other values of the headers the response varies on
+            if any(request_headers.get(name,'')!=value for name,value in json.loads(vary or '{}').items()):
+                return None
+            self.connection.execute('UPDATE entries SET accessed=? WHERE url=?',(time(),key))
+        try:
+            body=self.get_body_path(hash).read_bytes()
+        except OSError:
+            # The body was evicted by another process
+            return None
+        return {'status':status,'headers':json.loads(headers),'expires':expires,'etag':etag,'last_modified':last_modified,'body':body}
+
+    def store(self,key:str,status:int,headers:dict[str,str],body:bytes,expires:float,vary:dict[str,str]):
+        hash=sha256(body).hexdigest()
+        path=self.get_body_path(hash)
+        if not path.exists():
+            path.parent.mkdir(parents=True,exist_ok=True)
+            temporary=path.with_suffix(f'.{getpid()}.tmp')
+            temporary.write_bytes(body)
+            replace(temporary,path)
+        headers={key:value for key,value in headers.items() if key.lower() not in DROPPED_HEADERS}
+        with self.lock:
+            previous=self.connection.execute('SELECT size FROM entries WHERE url=?',(key,)).fetchone()
+            self.connection.execute('INSERT OR REPLACE INTO entries VALUES (?,?,?,?,?,?,?,?,?,?)',(
+                key,hash,status,json.dumps(headers),len(body),expires,headers.get('etag'),headers.get('last-modified'),time(),json.dumps(vary)
+            ))
+            self.total+=len(body)-(previous[0] if previous else 0)
+        self.evict()
+
+    def refresh(self,key:str,expires:float):
+        with self.lock:
+            self.connection.execute('UPDATE entries SET expires=?,accessed=? WHERE url=?',(expires,time(),key))
+
+    def evict(self):
+        '''Drop the least recently used entries until the cache is under nine tenths of its cap'''
+        with self.lock:
+            if self.total<=self.max_size:
+                return None
+            total=self.connection.execute('SELECT COALESCE(SUM(size),0) FROM entries').fetchone()[0]
+            self.total=total
+            if total<=self.max_size:
+                return None
+            target=total-self.max_size*0.9
+            hashes=set()
+            for url,hash,size in self.connection.execute('SELECT url,hash,size FROM entries ORDER BY accessed').fetchall():
+                if target<=0:
+                    break
+                self.connection.execute('DELETE FROM entries WHERE url=?',(url,))
+                hashes.add(hash)
+                target-=size
+                self.total-=size
+            # A body is shared by all the urls with the same content
+            orphans=[hash for hash in hashes if self.connection.execute('SELECT 1 FROM entries WHERE hash=? LIMIT 1',(hash,)).fetchone() is None]
+        for hash in orphans:
+            self.get_body_path(hash).unlink(missing_ok=True)
+
+    async def handle(self,route:Route):
+        request=route.request
+        if request.method!='GET' or request.resource_type not in CACHEABLE_TYPES:
+            await route.fallback()
+            return None
+        url=request.url
+        request_headers=await request.all_headers()
+        key=get_key(url,request_headers)
+        entry=await to_thread(self.lookup,key,request_headers)
+        now=time()
+        if entry is not None and entry.get('expires')>now:
+            self.stats['hits']+=1
+            await route.fulfill(status=entry.get('status'),headers=entry.get('headers'),body=entry.get('body'))
+            return None
+        headers=dict(request.headers)
+        if entry is not None:
+            if entry.get('etag'):
+                headers['if-none-match']=entry.get('etag')
+            if entry.get('last_modified'):
+                headers['if-modified-since']=entry.get('last_modified')
+        try:
+            response=await route.fetch(headers=headers)
+        except Exception:
+            await route.fallback()
+            return None
+        if entry is not None and response.status==304:
+            self.stats['revalidated']+=1
+            expires=get_expiry(response.headers,now)
+            if expires is not None:
+                await to_thread(self.refresh,key,expires)
+            await route.fulfill(status=entry.get('status'),headers=entry.get('headers'),body=entry.get('body'))
+            return None
+        self.stats['misses']+=1
+        await self.save(key,request_headers,response,now)
+        await route.fulfill(response=response)
+
+    async def save(self,key:str,request_headers:dict[str,str],response:APIResponse,now:float):
+        if response.status!=200:
+            return None
+        expires=get_expiry(response.headers,now)
+        vary=get_vary(request_headers,response.headers)
+        if expires is None or vary is None:
+            return None
+        body=await response.body()
+        await to_thread(self.store,key,response.status,response.headers,body,expires,vary)
+        self.stats['stored']+=1
+
+@cache
+def get_http_cache(directory:str,max_size:int)->HTTPCache:
+    '''One cache per directory in the process, the processes share it through the disk'''
+    return HTTPCache(directory,max_size)
@@ -1,5 +1,5 @@
 from dataclasses import dataclass,field
-from typing import Optional,Any
+from typing import Optional,Any,Literal
 
 @dataclass
 class ContextConfig:
@@ -7,7 +7,50 @@ class ContextConfig:
     minimum_wait_page_load_time:float=0.5
     wait_for_network_idle_page_load_time:float=1
     maximum_wait_page_load_time:float=5
+    network_quiet_time:float=0.5
+    dom_quiet_time:float=0.2
+    # Past this time a page still making only small mutations (tickers, carousels) counts as ready
+    dom_settle_time:float=1
+    # The requests in flight for longer (long polling) no longer hold the readiness check
+    long_request_time:float=3
     disable_security:bool=True
+    # Opt-in filter of the requests, the ad and tracker domains are blocked and each resource type gets a policy: allow, block or third-party (blocked when from another site than the page)
+    # Every request then goes through a Python route handler, which also bypasses the HTTP cache of the browser
+    filter_requests:bool=False
+    block_ads:bool=True
+    blocked_domains:list[str]=field(default_factory=list)
+    resource_policies:dict[str,Literal['allow','block','third-party']]=field(default_factory=dict)
+    dom_engine:Literal['script','snapshot','accessibility']='script'
+    incremental_dom:bool=True
+    max_text_length:int|None=1000
+    max_page_text_length:int|None=20000
+    # The scraped content past this many tokens comes back in numbered pages
+    scrape_chunk_tokens:int=4000
+    # Background tabs the crawl tool opens at once, and the tokens of content it returns per page
+    crawl_concurrency:int=4
+    crawl_page_tokens:int=1000
+    # The fetch and crawl tools first try a plain HTTP GET, the domains whose pages need the browser are remembered for the TTL in seconds
+    fast_fetch:bool=True
+    fast_fetch_timeout:float=10
+    fast_fetch_ttl:float|None=60*60
+    # Delay in ms between the keys when the type tool presses them one by one
+    typing_delay:int=80
+    # With use_vision='auto' the screenshot is taken below this many interactive elements or above this share of the viewport drawn by canvas, svg or media
+    auto_vision_min_elements:int=5
+    auto_vision_coverage:float=0.3
+    screenshot_format:Literal['jpeg','png','webp']='jpeg'
+    screenshot_quality:int=75
+    screenshot_max_width:int|None=1280
+    # Largest change of a block brightness (0-255) for the screen to count as unchanged, None always sends the screenshot
+    screenshot_dedupe_threshold:int|None=5
+    # Opt-in disk cache of the static resources, shared by the contexts of every process using the same directory (size in MB)
+    http_cache:bool=False
+    http_cache_dir:str='./cache/http'
+    http_cache_size:int=512
+    # Named session snapshot restored into the new context and saved when it closes, dropped past its TTL in seconds or on a login wall
+    session_name:str|None=None
+    sessions_dir:str='./sessions'
+    session_ttl:float|None=24*60*60
     user_agent:str="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/133.0.0.0 Safari/537.36"
 
 
@@ -88,4 +131,37 @@ IGNORED_URL_PATTERNS = set([
 	'wss://',
 	'cloudfront.net',
 	'fastly.net'
-])
\ No newline at end of file
+])
+
+BLOCKED_DOMAINS = set([
+	'doubleclick.net','googlesyndication.com','googleadservices.com',
+	'google-analytics.com','googletagmanager.com','googletagservices.com',
+	'adservice.google.com','amazon-adsystem.com','adnxs.com',
+	'criteo.com','criteo.net','taboola.com','outbrain.com',
+	'scorecardresearch.com','quantserve.com','moatads.com',
+	'pubmatic.com','rubiconproject.com','openx.net','adsrvr.org',
+	'casalemedia.com','advertising.com','yieldmo.com','3lift.com',
+	'sharethrough.com','media.net','bidswitch.net','smartadserver.com',
+	'hotjar.com','hotjar.io','clarity.ms','mouseflow.com','fullstory.com',
+	'segment.io','segment.com','mixpanel.com','amplitude.com','heap.io',
+	'newrelic.com','nr-data.net','optimizely.com','crazyegg.com',
+	'connect.facebook.net','ads-twitter.com','analytics.twitter.com',
+	'ads.linkedin.com','bat.bing.com','ads.yahoo.com','adform.net',
+	'onesignal.com','pushwoosh.com','branch.io','appsflyer.com'
+])
+
+# Typical transfer size in bytes of each resource type, the saving of the blocked requests is estimated from it, not measured
+ESTIMATED_RESOURCE_SIZES = {
+	'document':30_000,
+	'stylesheet':20_000,
+	'script':40_000,
+	'image':60_000,
+	'media':1_000_000,
+	'font':40_000,
+	'xhr':5_000,
+	'fetch':5_000,
+	'websocket':0,
+	'eventsource':0,
+	'ping':500,
+	'other':5_000
+}
@@ -0,0 +1,123 @@
+from src.agent.web.context.config import ContextConfig,BLOCKED_DOMAINS,ESTIMATED_RESOURCE_SIZES,IGNORED_URL_PATTERNS
+from playwright.async_api import Route,Request
+from urllib.parse import urlparse
+from collections import Counter,deque
+
+class AhoCorasick:
+    '''Aho-Corasick automaton, tells in one pass over the text whether it contains any of the patterns'''
+    def __init__(self,patterns:set[str]):
+        self.goto:list[dict[str,int]]=[{}]
+        self.fail:list[int]=[0]
+        self.output:list[bool]=[False]
+        for pattern in patterns:
+            state=0
+            for char in pattern:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(False)
+                    self.goto[state][char]=len(self.goto)-1
+                state=self.goto[state][char]
+            self.output[state]=True
+        # Breadth first, so the failure link of a state is set before its children need it
+        queue=deque(self.goto[0].values())
+        while queue:
+            state=queue.popleft()
+            for char,next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail=self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail=self.fail[fail]
+                self.fail[next_state]=self.goto[fail].get(char,0)
+                self.output[next_state]=self.output[next_state] or self.output[self.fail[next_state]]
+
+    def search(self,text:str)->bool:
+        state=0
+        for char in text:
+            while state and char not in self.goto[state]:
+                state=self.fail[state]
+            state=self.goto[state].get(char,0)
+            if self.output[state]:
+                return True
+        return False
+
+class DomainTrie:
+    '''Trie over the reversed labels of the domains, a host matches when it is one of the domains or a subdomain of one'''
+    def __init__(self,domains:set[str]):
+        self.root:dict={}
+        for domain in domains:
+            node=self.root
+            for label in reversed(domain.lower().strip('.').split('.')):
+                node=node.setdefault(label,{})
+            node['']=True
+
+    def match(self,host:str)->bool:
+        node=self.root
+        for label in reversed(host.lower().split('.')):
+            node=node.get(label)
+            if node is None:
+                return False
+            if '' in node:
+                return True
+        return False
+
+# Compiled once, is_ad_url checks every frame against it
+IGNORED_URL_MATCHER=AhoCorasick(IGNORED_URL_PATTERNS)
+
+def get_site(host:str)->str:
+    '''The registrable part of the host, approximated without the public suffix list'''
+    labels=host.lower().split('.')
+    # Country code second level domains such as co.uk or com.au
+    if len(labels)>2 and len(labels[-1])==2 and len(labels[-2])<=3:
+        return '.'.join(labels[-3:])
+    return '.'.join(labels[-2:])
+
+class RequestFilter:
+    '''Route handler blocking the ad and tracker domains and the resource types the policies exclude, the top level document is never blocked.'''
+    def __init__(self,config:ContextConfig):
+        self.config=config
+        self.domains=DomainTrie(BLOCKED_DOMAINS|set(config.blocked_domains))
+        self.blocked:Counter[str]=Counter()
+        self.allowed=0
+        # Estimated from the typical size of each resource type, the blocked responses are never downloaded
+        self.estimated_bytes_saved=0
+
+    def get_block_reason(self,request:Request)->str|None:
+        frame=request.frame
+        if request.is_navigation_request() and frame.parent_frame is None:
+            return None
+        host=urlparse(request.url).hostname
+        if not host:
+            return None
+        if self.config.block_ads and self.domains.match(host):
+            return 'ads'
+        policy=self.config.resource_policies.get(request.resource_type,'allow')
+        if policy=='block':
+            return request.resource_type
+        if policy=='third-party':
+            page_host=urlparse(frame.page.main_frame.url).hostname
+            if page_host and get_site(host)!=get_site(page_host):
+                return request.resource_type
+        return None
+
+    async def handle(self,route:Route):
+        request=route.request
+        try:
+            reason=self.get_block_reason(request)
+        except Exception:
+            # The frame of the request is gone, let it through
+            reason=None
+        if reason is None:
+            self.allowed+=1
+            await route.fallback()
+            return None
+        self.blocked[reason]+=1
+        self.estimated_bytes_saved+=ESTIMATED_RESOURCE_SIZES.get(request.resource_type,0)
+        await route.abort('blockedbyclient')
+
+    def stats(self)->dict:
+        return {'allowed':self.allowed,'blocked':sum(self.blocked.values()),'blocked_by_reason':dict(self.blocked),'estimated_bytes_saved':self.estimated_bytes_saved}
+
+    def report(self)->str:
+        reasons=', '.join(f'{count} {reason}' for reason,count in self.blocked.most_common())
+        return f'Blocked Requests: {sum(self.blocked.values())} ({reasons or "none"}) Allowed Requests: {self.allowed} Bytes Saved: ~{self.estimated_bytes_saved/1024/1024:.1f} MB (estimated from typical sizes)'
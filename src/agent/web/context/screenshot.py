@@ -0,0 +1,40 @@
+from src.agent.web.dom.views import BoundingBox
+from src.agent.web.dom.marks import draw_marks
+from PIL import Image, ImageChops
+from io import BytesIO
+
+# The fingerprint keeps the mean brightness of every 8x8 block, small enough to compare in microseconds while a single typed character still shows
+BLOCK_SIZE = 8
+FORMATS = {'jpeg':'JPEG','png':'PNG','webp':'WEBP'}
+
+def get_fingerprint(image:Image.Image,boxes:list[BoundingBox])->tuple[Image.Image,tuple]:
+    '''Perceptual fingerprint of the screen: the grayscale image averaged over blocks, with the boxes of the marks'''
+    return image.convert('L').reduce(BLOCK_SIZE),tuple((box.left,box.top,box.width,box.height) for box in boxes)
+
+def get_difference(a:tuple[Image.Image,tuple],b:tuple[Image.Image,tuple])->int:
+    '''Largest change of a block brightness between two fingerprints (0-255)'''
+    (pixels_a,boxes_a),(pixels_b,boxes_b)=a,b
+    # Moved or renumbered marks are a change even when the page pixels are the same
+    if boxes_a!=boxes_b or pixels_a.size!=pixels_b.size:
+        return 255
+    return ImageChops.difference(pixels_a,pixels_b).getextrema()[1]
+
+def load_screenshot(screenshot:bytes,boxes:list[BoundingBox])->tuple[Image.Image,tuple[Image.Image,tuple]]:
+    '''Decode the screenshot and take its fingerprint, before any of the resizing, drawing and encoding an unchanged screen does not need'''
+    image=Image.open(BytesIO(screenshot)).convert('RGB')
+    # Taken before drawing, the marks are compared by their boxes
+    return image,get_fingerprint(image,boxes)
+
+def render_screenshot(image:Image.Image,boxes:list[BoundingBox],format:str='jpeg',quality:int=75,max_width:int|None=None)->bytes:
+    '''Downscale the screenshot, draw the Set-of-Marks boxes and encode it.'''
+    scale=1.0
+    if max_width is not None and image.width>max_width:
+        scale=max_width/image.width
+        image=image.resize((max_width,round(image.height*scale)),Image.Resampling.LANCZOS)
+    draw_marks(image,boxes,scale=scale)
+    buffer=BytesIO()
+    if format=='png':
+        image.save(buffer,format=FORMATS[format])
+    else:
+        image.save(buffer,format=FORMATS[format],quality=quality)
+    return buffer.getvalue()
@@ -0,0 +1,67 @@
+from pathlib import Path
+from time import time
+from os import replace,getpid
+import json
+import re
+
+# Set in the restored tabs so the snapshot is applied once, not on every navigation of the tab
+RESTORED_KEY='__agent_session_restored'
+# The bare auth and sso paths are left out, the OAuth callbacks and SSO redirects of a working session live there
+LOGIN_URL_PATTERN=re.compile(r'/(login|log-in|signin|sign-in|sign_in)\b',re.IGNORECASE)
+LOGIN_TITLE_PATTERN=re.compile(r'\b(log ?in|sign ?in|log on)\b',re.IGNORECASE)
+LOGIN_AUTOCOMPLETE={'username','email','current-password'}
+# A login form is the main form of the page when there are at most this many interactive elements
+LOGIN_FORM_MAX_ELEMENTS=20
+
+class SessionStore:
+    '''Named session snapshots on disk: the storage state of the context (cookies, localStorage, IndexedDB) and the sessionStorage of its tabs.'''
+    def __init__(self,directory:str,ttl:float|None=None):
+        self.directory=Path(directory)
+        self.ttl=ttl
+
+    def get_path(self,name:str)->Path:
+        return self.directory.joinpath(f'{re.sub(r'[^\w.-]','_',name)}.json')
+
+    def load(self,name:str)->dict|None:
+        '''The snapshot, None when there is none or it is past its TTL'''
+        path=self.get_path(name)
+        try:
+            with open(path) as f:
+                snapshot=json.load(f)
+        except (OSError,ValueError):
+            return None
+        if self.ttl is not None and time()-snapshot.get('created',0)>self.ttl:
+            self.invalidate(name)
+            return None
+        return snapshot
+
+    def save(self,name:str,storage_state:dict,session_storage:dict[str,list]):
+        self.directory.mkdir(parents=True,exist_ok=True)
+        path=self.get_path(name)
+        # Written aside and renamed, the contexts of other processes never read a partial snapshot
+        temporary=path.with_suffix(f'.{getpid()}.tmp')
+        with open(temporary,'w') as f:
+            json.dump({'created':time(),'storage_state':storage_state,'session_storage':session_storage},f)
+        replace(temporary,path)
+
+    def invalidate(self,name:str):
+        self.get_path(name).unlink(missing_ok=True)
+
+def get_session_storage_script(session_storage:dict[str,list])->str:
+    '''Init script restoring the sessionStorage of the origin of the page'''
+    return f'''(() => {{
+    const storage = {json.dumps(session_storage)};
+    const items = storage[location.origin];
+    if (!items || sessionStorage.getItem('{RESTORED_KEY}')) return;
+    for (const [key, value] of items) sessionStorage.setItem(key, value);
+    sessionStorage.setItem('{RESTORED_KEY}', '1');
+}})();'''
+
+def is_login_wall(url:str,title:str,attributes:list[dict[str,str]])->bool:
+    '''The page asks to log in: a login url or title together with a login form that is the main form of the page'''
+    if not (LOGIN_URL_PATTERN.search(url or '') or LOGIN_TITLE_PATTERN.search(title or '')):
+        return False
+    # A password field, or the username step of a two-step login
+    has_form=any(attribute.get('type')=='password' or attribute.get('autocomplete','').lower() in LOGIN_AUTOCOMPLETE for attribute in attributes)
+    # The login box in the header of a page the session can use sits among many other elements
+    return has_form and len(attributes)<=LOGIN_FORM_MAX_ELEMENTS
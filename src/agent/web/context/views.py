@@ -19,6 +19,7 @@ class BrowserState:
 	tabs:list[Tab]=field(default_factory=list)
 	screenshot:Optional[str]=None
 	dom_state:DOMState=field(default_factory=DOMState([]))
+	screenshot_unchanged:bool=False
 	
 	def tabs_to_string(self)->str:
 		return '\n'.join([tab.to_string() for tab in self.tabs])
@@ -1,95 +1,136 @@
-from src.agent.web.dom.views import DOMElementNode, DOMTextualNode, DOMState, CenterCord, BoundingBox
-from playwright.async_api import Page, Frame
-from typing import TYPE_CHECKING
-from asyncio import sleep
+from src.agent.web.dom.views import DOMElementNode, DOMTextualNode, DOMState
+from playwright.async_api import Page, Frame, Error as PlaywrightError
+from typing import TYPE_CHECKING,Literal
+from asyncio import sleep,gather
+from time import perf_counter
+from functools import cache
 
 if TYPE_CHECKING:
     from src.agent.web.context import Context
 
+@cache
+def get_dom_script()->str:
+    '''Read the extraction script once, it is registered as an init script on every context.'''
+    with open('./src/agent/web/dom/script.js') as f:
+        return f.read()
+
 class DOM:
     def __init__(self, context:'Context'):
         self.context=context
+        # Set by the engines that render the observation as an outline instead of element lists
+        self.outline:str|None=None
 
-    async def get_state(self,use_vision:bool=False,freeze:bool=False)->tuple[str|None,DOMState]:
+    async def get_state(self,use_vision:bool|Literal['auto']=False,freeze:bool=False)->tuple[str|None,DOMState]:
         '''Get the state of the webpage.'''
         try:
             selector_map={}
             if freeze:
                 await sleep(5)
-            with open('./src/agent/web/dom/script.js') as f:
-                script=f.read()
             page=await self.context.get_current_page()
             await page.wait_for_load_state('domcontentloaded',timeout=10*1000)
-            await self.context.execute_script(page,script)
+            await self.context.wait_for_ready()
             #Access from frames
             frames=page.frames
-            interactive_nodes,informative_nodes=await self.get_elements(frames=frames)
+            start=perf_counter()
+            interactive_nodes,informative_nodes,timings,frame_map=await self.get_elements(frames=frames)
+            timings['total']=(perf_counter()-start)*1000
+            if use_vision=='auto':
+                use_vision=await self.needs_vision(page,interactive_nodes)
             if use_vision:
-                # Add bounding boxes to the interactive elements
-                boxes=map(lambda node:node.bounding_box.to_dict(),interactive_nodes)
-                await self.context.execute_script(page,'boxes=>{mark_page(boxes)}',list(boxes))
+                # The boxes of the interactive elements are drawn onto it by the context, the page is left untouched
                 screenshot=await self.context.get_screenshot(save_screenshot=False)
-                # Remove bounding boxes from the interactive elements
                 if freeze:
                     await sleep(10)
-                await sleep(0.1)
-                await self.context.execute_script(page,'unmark_page()')
             else:
                 screenshot=None
         except Exception as e:
             print(f"Failed to get elements from page: {page.url}\nError: {e}")
-            interactive_nodes,informative_nodes=[],[]
+            interactive_nodes,informative_nodes,timings,frame_map=[],[],{},{}
             screenshot=None
         selector_map=dict(enumerate(interactive_nodes))
-        return (screenshot,DOMState(interactive_nodes=interactive_nodes,informative_nodes=informative_nodes,selector_map=selector_map))
+        return (screenshot,DOMState(interactive_nodes=interactive_nodes,informative_nodes=informative_nodes,selector_map=selector_map,timings=timings,frames=frame_map,outline=self.outline))
     
-    async def get_elements(self,frames:list[Frame|Page])->tuple[list[DOMElementNode],list[DOMTextualNode]]:
-        '''Get the interactive elements of the webpage.'''
-        interactive_elements,informative_elements=[],[]
-        with open('./src/agent/web/dom/script.js') as f:
-            script=f.read()
+    async def needs_vision(self,page:Page,interactive_nodes:list[DOMElementNode])->bool:
+        '''Decide whether the screenshot is needed: the page has few interactive elements or is mostly drawn by canvas, svg or media.'''
+        config=self.context.config
+        if len(interactive_nodes)<config.auto_vision_min_elements:
+            return True
         try:
-            for index,frame in enumerate(frames):
-                if frame.is_detached():
-                    continue
-                # print(f"Getting elements from frame: {frame.url}")
-                await self.context.execute_script(frame,script)  # Inject JS
-                #index=0 means Main Frame
-                if index>0 and not await self.context.is_frame_visible(frame=frame):
-                    continue
-                # print(f"Getting elements from frame: {frame.url}")
-                await self.context.execute_script(frame,script)
-                nodes:dict=await self.context.execute_script(frame,'getElements()')
-                element_nodes,textual_nodes=nodes.values()
-                if index>0:
-                    frame_element =await frame.frame_element()
-                    frame_xpath=await self.context.execute_script(frame,'(frame_element)=>getXPath(frame_element)',frame_element)
-                else:
-                    frame_xpath=''
-                for element in element_nodes:
-                    element_xpath=element.get('xpath')
-                    node=DOMElementNode(**{
-                        'tag':element.get('tag'),
-                        'role':element.get('role'),
-                        'name':element.get('name'),
-                        'attributes':element.get('attributes'),
-                        'center':CenterCord(**element.get('center')),
-                        'bounding_box':BoundingBox(**element.get('box')),
-                        'xpath':{'frame':frame_xpath,'element':element_xpath}
-                    })
-                    interactive_elements.append(node)
-                
-                for element in textual_nodes:
-                    element_xpath=element.get('xpath')
-                    node=DOMTextualNode(**{
-                        'tag':element.get('tag'),
-                        'role':element.get('role'),
-                        'content':element.get('content'),
-                        'center':CenterCord(**element.get('center')),
-                        'xpath':{'frame':frame_xpath,'element':element_xpath}
-                    })
-                    informative_elements.append(node)
+            coverage=await self.context.execute_script(page,'()=>getVisualCoverage()')
+        except PlaywrightError:
+            return True
+        return coverage>=config.auto_vision_coverage
+
+    async def get_elements(self,frames:list[Frame|Page])->tuple[list[DOMElementNode],list[DOMTextualNode],dict[str,float],dict[str,Frame]]:
+        '''Get the interactive elements of the webpage from all the visible frames concurrently.'''
+        interactive_elements,informative_elements,timings,frame_map=[],[],{},{}
+        results=await gather(*[self.get_frame_elements(index=index,frame=frame) for index,frame in enumerate(frames)])
+        # Results are merged in frame order so the indices stay deterministic
+        for frame,(element_nodes,textual_nodes,frame_timings) in zip(frames,results):
+            if element_nodes:
+                # The frames are kept by their xpath so the actions can resolve the agent ids in them
+                frame_map[element_nodes[0].xpath.get('frame')]=frame
+            interactive_elements.extend(element_nodes)
+            informative_elements.extend(textual_nodes)
+            # The in-page phase timings are summed over the frames
+            for phase,duration in frame_timings.items():
+                timings[phase]=timings.get(phase,0)+duration
+        informative_elements=self.cap_text(informative_elements)
+        return interactive_elements,informative_elements,timings,frame_map
 
+    def cap_text(self,nodes:list[DOMTextualNode])->list[DOMTextualNode]:
+        '''Apply the page text cap over all the frames, each frame is already capped on its own.'''
+        remaining=self.context.config.max_page_text_length
+        if remaining is None:
+            return nodes
+        capped=[]
+        for node in nodes:
+            if remaining<=0:
+                break
+            if len(node.content)>remaining:
+                node.content=f'{node.content[:remaining]}…'
+            capped.append(node)
+            remaining-=len(node.content)
+        return capped
+
+    async def get_frame_elements(self,index:int,frame:Frame)->tuple[list[DOMElementNode],list[DOMTextualNode],dict[str,float]]:
+        '''Get the interactive and informative elements of a single frame.'''
+        interactive_elements,informative_elements,timings=[],[],{}
+        try:
+            if frame.is_detached():
+                return interactive_elements,informative_elements,timings
+            #index=0 means Main Frame
+            if index>0 and not await self.context.is_frame_visible(frame=frame):
+                return interactive_elements,informative_elements,timings
+            nodes:dict=await self.extract(frame)
+            element_nodes,textual_nodes=nodes.get('interactiveElements'),nodes.get('informativeElements')
+            timings=nodes.get('timings',{})
+            if index>0:
+                frame_element =await frame.frame_element()
+                frame_xpath=await self.context.execute_script(frame,'(frame_element)=>getXPath(frame_element)',frame_element)
+            else:
+                frame_xpath=''
+            interactive_elements=DOMElementNode.from_columns(element_nodes,frame_xpath=frame_xpath)
+            informative_elements=DOMTextualNode.from_columns(textual_nodes,frame_xpath=frame_xpath)
         except Exception as e:
             print(f"Failed to get elements from frame: {frame.url}\nError: {e}")
-        return interactive_elements,informative_elements
+        return interactive_elements,informative_elements,timings
+
+    async def extract(self,frame:Frame)->dict:
+        '''Run the extraction script, the script is injected only if the init script has not reached the frame (e.g. documents loaded before it was registered).'''
+        script='options=>getElements(options)'
+        config=self.context.config
+        # With incremental extraction the page re-walks only the subtrees its change journal marked dirty
+        options={
+            'incremental':config.incremental_dom,
+            'columnar':True,
+            'maxTextLength':config.max_text_length,
+            'maxPageTextLength':config.max_page_text_length
+        }
+        try:
+            return await self.context.execute_script(frame,script,options)
+        except PlaywrightError as e:
+            if 'getElements is not defined' not in str(e):
+                raise e
+        await self.context.execute_script(frame,get_dom_script())
+        return await self.context.execute_script(frame,script,options)
@@ -0,0 +1,116 @@
+from src.agent.web.dom.config import AX_INTERACTIVE_ROLES,AX_LEAF_ROLES,AX_COLLAPSED_ROLES,AX_STATES,SAFE_ATTRIBUTES,COMPUTED_STYLES
+from src.agent.web.dom.views import DOMElementNode, DOMTextualNode, CenterCord, BoundingBox
+from src.agent.web.dom.snapshot import SnapshotDOM,SnapshotParser,DocumentParser
+from playwright.async_api import Page, Frame
+from time import perf_counter
+from asyncio import gather
+
+class AccessibilityDOM(SnapshotDOM):
+    '''Renders the observation as an indented role/name outline of the accessibility tree (CDP Accessibility.getFullAXTree), the boxes and xpaths come from a DOMSnapshot of the same page.'''
+    async def get_elements(self,frames:list[Frame|Page])->tuple[list[DOMElementNode],list[DOMTextualNode],dict[str,float],dict[str,Frame]]:
+        if self.context.browser.config.browser=='firefox':
+            return await super().get_elements(frames=frames)
+        page=await self.context.get_current_page()
+        start=perf_counter()
+        session=await page.context.new_cdp_session(page)
+        try:
+            tree,snapshot,metrics=await gather(
+                session.send('Accessibility.getFullAXTree'),
+                session.send('DOMSnapshot.captureSnapshot',{'computedStyles':COMPUTED_STYLES,'includeDOMRects':True}),
+                session.send('Page.getLayoutMetrics')
+            )
+        finally:
+            await session.detach()
+        capture=(perf_counter()-start)*1000
+        start=perf_counter()
+        viewport=metrics.get('cssLayoutViewport')
+        parser=SnapshotParser(snapshot=snapshot,width=viewport.get('clientWidth'),height=viewport.get('clientHeight'),context=self.context)
+        outline=AccessibilityOutline(tree.get('nodes'),parser)
+        self.outline=outline.render()
+        timings={'capture':capture,'parse':(perf_counter()-start)*1000}
+        return outline.interactive_elements,[],timings,{}
+
+class AccessibilityOutline:
+    '''Renders the accessibility tree of the main frame, limited to the viewport'''
+    def __init__(self,nodes:list[dict],parser:SnapshotParser):
+        self.nodes={node.get('nodeId'):node for node in nodes}
+        self.root=nodes[0].get('nodeId') if nodes else None
+        self.parser=parser
+        self.document=DocumentParser(parser,index=0,left=0,top=0,frame_xpath='') if parser.documents else None
+        backend_ids=self.document.backend_node_id if self.document else []
+        self.dom_nodes:dict[int,int]={backend_id:node for node,backend_id in enumerate(backend_ids)}
+        self.interactive_elements:list[DOMElementNode]=[]
+
+    def render(self)->str:
+        if self.root is None:
+            return ''
+        return '\n'.join(self.render_node(self.root,depth=0))
+
+    def value(self,node:dict,key:str)->str:
+        return str((node.get(key) or {}).get('value') or '').strip()
+
+    def states(self,node:dict)->str:
+        states=[]
+        for property in node.get('properties',[]):
+            name,value=property.get('name'),property.get('value',{}).get('value')
+            if name in AX_STATES and value not in (None,False,'false'):
+                states.append(name if value in (True,'true') else f'{name}={value}')
+        value=self.value(node,'value')
+        if value:
+            states.insert(0,f'value="{self.parser.truncate(value)}"')
+        return f' {" ".join(states)}' if states else ''
+
+    def get_rect(self,node:dict)->tuple|None:
+        '''The box of the DOM node behind the AX node if it is rendered inside the viewport'''
+        dom_node=self.dom_nodes.get(node.get('backendDOMNodeId'))
+        if dom_node is None:
+            return None
+        attributes=self.document.get_attributes(dom_node) if self.document.node_type[dom_node]==1 else {}
+        style=self.document.get_style(dom_node)
+        rect=self.document.get_rect(dom_node)
+        # Text nodes have a box but no computed styles of their own
+        if style is None and rect is not None:
+            style=dict.fromkeys(COMPUTED_STYLES,'')
+        return rect if self.document.is_visible(attributes,style,rect) else None
+
+    def render_node(self,node_id:str,depth:int)->list[str]:
+        node=self.nodes.get(node_id)
+        if node is None:
+            return []
+        children=node.get('childIds',[])
+        indent='  '*depth
+        if node.get('ignored'):
+            return [line for child in children for line in self.render_node(child,depth)]
+        role=self.value(node,'role')
+        name=self.parser.truncate(self.value(node,'name'))
+        if role in AX_INTERACTIVE_ROLES:
+            rect=self.get_rect(node)
+            if rect is not None:
+                index=len(self.interactive_elements)
+                self.interactive_elements.append(self.element_node(node,role,name,rect))
+                line=f'{indent}[{index}] {role} "{name}"{self.states(node)}'
+                if role in AX_LEAF_ROLES:
+                    return [line]
+                return [line]+[line for child in children for line in self.render_node(child,depth+1)]
+        if role=='StaticText':
+            return [f'{indent}"{name}"'] if name and self.get_rect(node) is not None else []
+        lines=[line for child in children for line in self.render_node(child,depth+1)]
+        # Unnamed containers are collapsed into their children
+        if role in AX_COLLAPSED_ROLES or not name:
+            return [line[2:] for line in lines]
+        if role in AX_LEAF_ROLES:
+            return [f'{indent}{role} "{name}"'] if self.get_rect(node) is not None else []
+        return [f'{indent}{role} "{name}"']+lines if lines else []
+
+    def element_node(self,node:dict,role:str,name:str,rect:tuple)->DOMElementNode:
+        dom_node=self.dom_nodes.get(node.get('backendDOMNodeId'))
+        left,top,width,height=rect
+        return DOMElementNode(**{
+            'tag':self.document.tag(dom_node),
+            'role':role,
+            'name':name or 'none',
+            'attributes':{key:value for key,value in self.document.get_attributes(dom_node).items() if key in SAFE_ATTRIBUTES},
+            'center':CenterCord(x=int(left+width/2),y=int(top+height/2)),
+            'bounding_box':BoundingBox(left=round(left),top=round(top),width=round(width),height=round(height)),
+            'xpath':{'frame':'','element':self.document.get_xpath(dom_node)}
+        })
@@ -0,0 +1,54 @@
+from src.agent.web.dom.views import DOMElementNode,DOMTextualNode
+from src.agent.web.dom.snapshot import SnapshotDOM
+from src.agent.web.dom import DOM
+from typing import TYPE_CHECKING
+from statistics import median
+from time import perf_counter
+
+if TYPE_CHECKING:
+    from src.agent.web.context import Context
+
+def get_coverage(reference:set,candidate:set)->float:
+    '''Share of the reference found by the candidate'''
+    return len(reference&candidate)/len(reference) if reference else 1.0
+
+def element_keys(nodes:list[DOMElementNode])->set[tuple[str,str]]:
+    '''Both engines emit the xpath of the interactive elements, a node without one cannot be matched and would collapse the set'''
+    keys={(node.xpath.get('frame'),node.xpath.get('element')) for node in nodes if node.xpath.get('element')}
+    if nodes and not keys:
+        raise Exception('The engine emitted no element xpaths, the coverage cannot be measured')
+    return keys
+
+def text_keys(nodes:list[DOMTextualNode])->set[str]:
+    return {node.content for node in nodes}
+
+async def compare_engines(context:'Context',runs:int=5)->dict:
+    '''Time the script walker and the snapshot engine on the current page, and check that the snapshot finds what the walker finds'''
+    page=await context.get_current_page()
+    incremental=context.config.incremental_dom
+    # Every run of the walker must be a full walk to compare like for like
+    context.config.incremental_dom=False
+    try:
+        results={}
+        for name,engine in (('script',DOM(context)),('snapshot',SnapshotDOM(context))):
+            durations=[]
+            for _ in range(runs):
+                start=perf_counter()
+                interactive_nodes,informative_nodes,_,_=await engine.get_elements(frames=page.frames)
+                durations.append((perf_counter()-start)*1000)
+            results[name]={'median':median(durations),'min':min(durations),'interactive':interactive_nodes,'informative':informative_nodes}
+    finally:
+        context.config.incremental_dom=incremental
+    script,snapshot=results.get('script'),results.get('snapshot')
+    return {
+        'url':page.url,
+        'script_ms':script.get('median'),
+        'snapshot_ms':snapshot.get('median'),
+        'speedup':script.get('median')/snapshot.get('median') if snapshot.get('median') else None,
+        'interactive':{'script':len(script.get('interactive')),'snapshot':len(snapshot.get('interactive'))},
+        'informative':{'script':len(script.get('informative')),'snapshot':len(snapshot.get('informative'))},
+        # Matched by xpath for the elements and by content for the text
+        'interactive_coverage':get_coverage(element_keys(script.get('interactive')),element_keys(snapshot.get('interactive'))),
+        'informative_coverage':get_coverage(text_keys(script.get('informative')),text_keys(snapshot.get('informative'))),
+        'missing':sorted(element_keys(script.get('interactive'))-element_keys(snapshot.get('interactive')))[:20]
+    }
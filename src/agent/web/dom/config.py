@@ -0,0 +1,84 @@
+# Mirrors the constants of script.js for the engines that classify the nodes in Python
+
+INTERACTIVE_TAGS = set([
+    'a', 'button', 'embed', 'input', 'option', 'canvas', 'summary',
+    'menu', 'menuitem', 'object', 'select', 'textarea', 'banner',
+])
+
+INFORMATIVE_TAGS = set([
+    'h1','h2','h3','h4','h5','h6','p','label',
+    'dl','dt','dd','code','pre','img','div',
+    'table','tbody','thead','th','td','article'
+])
+
+EXPLORABLE_TAGS = set([
+    'div','span','article','section','nav','header','footer','main','ul','ol','details'
+])
+
+EXCLUDED_TAGS = set([
+    'style', 'script', 'noscript','link','meta'
+])
+
+INTERACTIVE_ROLES = set([
+    'button', 'menu', 'menuitem', 'link', 'checkbox', 'radio',
+    'slider', 'tab', 'tabpanel', 'textbox', 'combobox', 'gridcell',
+    'option', 'progressbar', 'scrollbar', 'searchbox','listbox',
+    'switch', 'tree', 'treeitem', 'spinbutton', 'tooltip', 'a-button-inner',
+    'a-dropdown-button', 'click','menuitemcheckbox', 'menuitemradio',
+    'a-button-text', 'button-text', 'button-icon', 'button-icon-only',
+    'button-text-icon-only', 'dropdown'
+])
+
+INFORMATIVE_ROLES = set([
+    'article','document','heading','note',
+    'definition','paragraph','contentinfo',
+    'status','alert','log','tooltip','text',
+    'term','region','presentation'
+])
+
+SAFE_ATTRIBUTES = set([
+    'name','type','value','placeholder','label','aria-label','aria-labelledby','aria-describedby','role',
+    'for','autocomplete','required','readonly','alt','title','data-testid','data-id','data-qa',
+    'data-cy','href','target','tabindex','class','data-tooltip'
+])
+
+CLICK_ATTRIBUTES = ['onclick', 'v-on:click', '@click', 'ng-click']
+
+EVENT_ATTRIBUTES = ['onfocus', 'onblur', 'onchange', 'oninput', 'onkeydown', 'onkeyup', 'onmousedown', 'onmouseup']
+
+LINK_ATTRIBUTES = ['href', 'download']
+
+DATA_ATTRIBUTES = ['data-tooltip', 'data-testid']
+
+NAME_ATTRIBUTES = ['name','aria-label','title','aria-labelledby','aria-describedby','label']
+
+# The computed styles requested from DOMSnapshot.captureSnapshot, in this order
+COMPUTED_STYLES = ['display','visibility','opacity','cursor','position']
+
+# Step of an xpath crossing from a shadow host into its shadow root, the path after it is relative to the root
+SHADOW_ROOT_STEP = '#shadow-root'
+
+# Roles of the accessibility tree that are numbered in the outline
+AX_INTERACTIVE_ROLES = set([
+    'button', 'link', 'textbox', 'searchbox', 'combobox', 'checkbox', 'radio',
+    'menuitem', 'menuitemcheckbox', 'menuitemradio', 'tab', 'option', 'switch',
+    'slider', 'spinbutton', 'listbox', 'treeitem', 'menu', 'tree', 'ColorWell',
+    'DisclosureTriangle', 'PopUpButton', 'ToggleButton'
+])
+
+# Roles whose children only repeat their name
+AX_LEAF_ROLES = set([
+    'button', 'link', 'textbox', 'searchbox', 'checkbox', 'radio', 'menuitem',
+    'menuitemcheckbox', 'menuitemradio', 'tab', 'option', 'switch', 'slider',
+    'spinbutton', 'treeitem', 'heading', 'image', 'img', 'ColorWell',
+    'DisclosureTriangle', 'PopUpButton', 'ToggleButton'
+])
+
+# Roles that never get a line of their own in the outline
+AX_COLLAPSED_ROLES = set([
+    'generic', 'none', 'presentation', 'GenericContainer', 'InlineTextBox',
+    'LineBreak', 'LayoutTable', 'LayoutTableRow', 'LayoutTableCell', 'paragraph',
+    'Section', 'group', 'list', 'listitem', 'ListMarker'
+])
+
+AX_STATES = ['checked', 'expanded', 'selected', 'pressed', 'disabled', 'required', 'focused', 'invalid']
@@ -0,0 +1,32 @@
+from src.agent.web.dom.views import BoundingBox
+from PIL import Image, ImageDraw, ImageFont
+from functools import cache
+
+# Fixed palette so an element keeps its color between the steps
+COLORS = ['#E6194B','#3CB44B','#4363D8','#F58231','#911EB4','#008080','#F032E6','#9A6324','#800000','#000075']
+LABEL_SIZE = 12
+
+@cache
+def get_font()->ImageFont.ImageFont:
+    return ImageFont.load_default(size=LABEL_SIZE)
+
+def draw_marks(image:Image.Image,boxes:list[BoundingBox],scale:float=1.0):
+    '''Draw the Set-of-Marks boxes and their indices onto the image, the boxes are in CSS pixels and scaled to the image.'''
+    draw=ImageDraw.Draw(image)
+    font=get_font()
+    width,height=image.size
+    for index,box in enumerate(boxes):
+        color=COLORS[index%len(COLORS)]
+        left,top=box.left*scale,box.top*scale
+        right,bottom=(box.left+box.width)*scale,(box.top+box.height)*scale
+        if right<0 or bottom<0 or left>width or top>height:
+            continue
+        draw.rectangle([left,top,right,bottom],outline=color,width=2)
+        # The label sits on the top right corner, above the box when there is room for it
+        label=str(index)
+        text_left,text_top,text_right,text_bottom=draw.textbbox((0,0),label,font=font)
+        label_width,label_height=text_right-text_left+4,text_bottom-text_top+4
+        label_left=max(0,right-label_width)
+        label_top=top-label_height if top-label_height>=0 else top
+        draw.rectangle([label_left,label_top,label_left+label_width,label_top+label_height],fill=color)
+        draw.text((label_left+2-text_left,label_top+2-text_top),label,fill='white',font=font)
@@ -42,8 +42,6 @@ const SAFE_ATTRIBUTES = new Set([
     'data-cy','href','target','tabindex','class','data-tooltip'
 ]);
 
-const labels = [];
-
 async function injectAllCSS() {
     const stylesheets = document.styleSheets;
     let allCSS = ""; // Store all CSS content
@@ -88,6 +86,11 @@ async function injectAllCSS() {
             let part = `${tagName}[${index}]`;
             parts.unshift(part);
             element = element.parentNode;
+            // Cross a shadow root through its host, the resolver walks back into it
+            if (element instanceof ShadowRoot) {
+                parts.unshift('#shadow-root');
+                element = element.host;
+            }
         }
         return "/" + parts.join("/");
     }
@@ -102,62 +105,270 @@ async function injectAllCSS() {
             });
         } 
 
+// Change journal: records the subtrees mutated since the last extraction
+    const journal = {
+        observer: null,
+        dirty: new Set(),
+        overflow: false,
+        snapshot: null,
+        lastMutation: 0,
+        lastLargeMutation: 0
+    };
+
+    // A batch of mutations past this many changed nodes is a change of the page, the smaller ones may be a ticker or a carousel
+    const SMALL_MUTATION_SIZE = 20;
+
+    // Beyond this many dirty subtrees a full walk is cheaper than merging
+    const MAX_DIRTY_ROOTS = 50;
+
+    function markDirty(node) {
+        if (journal.overflow) return;
+        const element = node && node.nodeType === Node.ELEMENT_NODE ? node : node?.parentElement;
+        if (!element) return;
+        journal.dirty.add(element);
+        if (journal.dirty.size > MAX_DIRTY_ROOTS) {
+            journal.overflow = true;
+            journal.dirty.clear();
+        }
+    }
+
+    function startJournal() {
+        if (journal.observer || !document.documentElement) return;
+        journal.observer = new MutationObserver(records => {
+            let size = 0;
+            for (const record of records) {
+                // Stamping the agent ids is not a change of the page
+                if (record.type === 'attributes' && record.attributeName === AGENT_ID_ATTRIBUTE) continue;
+                markDirty(record.target);
+                journal.lastMutation = performance.now();
+                size += 1 + record.addedNodes.length + record.removedNodes.length;
+            }
+            if (size > SMALL_MUTATION_SIZE) journal.lastLargeMutation = performance.now();
+        });
+        journal.observer.observe(document.documentElement, {
+            subtree: true, childList: true, attributes: true, characterData: true
+        });
+        // Scrolling a container reveals elements without mutating the DOM
+        document.addEventListener('scroll', (event) => {
+            const target = event.target;
+            if (target === document || target === document.documentElement || target === document.body) {
+                journal.overflow = true;
+            } else {
+                markDirty(target);
+            }
+        }, { capture: true, passive: true });
+        window.addEventListener('resize', () => { journal.overflow = true; }, { passive: true });
+        journal.lastMutation = journal.lastLargeMutation = performance.now();
+    }
+
+    // Started as soon as the document exists, so the readiness check knows when the page last mutated
+    if (document.documentElement) startJournal();
+    else document.addEventListener('DOMContentLoaded', startJournal, { once: true });
+
+// Readiness: the DOM stopped mutating, a frame was painted and the web fonts are loaded, each bounded by the deadline
+    // A page that keeps making only small mutations (tickers, carousels) is taken as steady once the settle time has passed
+    async function waitForReady(options = {}) {
+        const { quietTime = 200, settleTime = 1000, timeout = 5000 } = options;
+        startJournal();
+        const start = performance.now();
+        let steady = false;
+        const remaining = () => Math.max(0, timeout - (performance.now() - start));
+        const withDeadline = promise => Promise.race([
+            promise.then(() => true, () => true),
+            new Promise(resolve => setTimeout(() => resolve(false), remaining()))
+        ]);
+        const quiet = new Promise(resolve => {
+            const check = () => {
+                const now = performance.now();
+                const idle = now - journal.lastMutation;
+                if (idle >= quietTime) return resolve();
+                if (now - start >= settleTime && now - journal.lastLargeMutation >= quietTime) {
+                    steady = true;
+                    return resolve();
+                }
+                setTimeout(check, Math.min(quietTime - idle, Math.max(0, settleTime - (now - start)) || quietTime));
+            };
+            check();
+        });
+        // Two frames: the first one runs before the pending layout, the second one after it was painted
+        const painted = new Promise(resolve => requestAnimationFrame(() => requestAnimationFrame(resolve)));
+        const fonts = document.fonts ? document.fonts.ready : Promise.resolve();
+        const [dom, frame, font] = await Promise.all([withDeadline(quiet), withDeadline(painted), withDeadline(fonts)]);
+        return { dom, steady, frame, fonts: font, elapsed: performance.now() - start };
+    }
+
+// Visual coverage: share of the viewport drawn by canvas, svg and media, content the element lists cannot describe
+    const VISUAL_SELECTOR = 'canvas, svg, video, embed, object';
+
+    function getVisualCoverage() {
+        const width = window.innerWidth, height = window.innerHeight;
+        let area = 0;
+        for (const element of document.querySelectorAll(VISUAL_SELECTOR)) {
+            // The svg inside an svg is already counted with its parent
+            if (element.parentElement?.closest('svg')) continue;
+            const rect = element.getBoundingClientRect();
+            const visibleWidth = Math.min(rect.right, width) - Math.max(rect.left, 0);
+            const visibleHeight = Math.min(rect.bottom, height) - Math.max(rect.top, 0);
+            if (visibleWidth <= 0 || visibleHeight <= 0) continue;
+            area += visibleWidth * visibleHeight;
+        }
+        return Math.min(1, area / Math.max(1, width * height));
+    }
+
+// Stable agent ids: kept on the node, and carried over to a re-rendered node with the same fingerprint
+    const AGENT_ID_ATTRIBUTE = 'data-agent-id';
+    const agentRegistry = {
+        nextId: 0,
+        elements: new Map(), // id -> WeakRef of the element
+        fingerprints: new Map(), // fingerprint -> id
+        ids: new Map() // id -> { tag, fingerprint }
+    };
+
+    function getFingerprint(element) {
+        return [
+            element.tagName.toLowerCase(),
+            ...['role', 'name', 'type', 'aria-label', 'placeholder', 'href', 'title'].map(attr => element.getAttribute(attr) ?? ''),
+            element.textContent.trim().slice(0, 64)
+        ].join('|');
+    }
+
+    function stampAgentId(element) {
+        let id = element.getAttribute(AGENT_ID_ATTRIBUTE);
+        const owner = id && agentRegistry.elements.get(id)?.deref();
+        // A node copied with cloneNode (carousels, virtual lists) carries the id of its original, still in the page
+        if (id && (!agentRegistry.ids.has(id) || (owner && owner !== element && owner.isConnected))) id = null;
+        if (!id) {
+            const fingerprint = getFingerprint(element);
+            const previousId = agentRegistry.fingerprints.get(fingerprint);
+            const previousElement = previousId && agentRegistry.elements.get(previousId)?.deref();
+            // Reuse the id when the element it belonged to has been replaced
+            id = previousId && !previousElement?.isConnected ? previousId : String(agentRegistry.nextId++);
+            agentRegistry.fingerprints.set(fingerprint, id);
+            agentRegistry.ids.set(id, { tag: element.tagName, fingerprint });
+            element.setAttribute(AGENT_ID_ATTRIBUTE, id);
+        }
+        agentRegistry.elements.set(id, new WeakRef(element));
+        return id;
+    }
+
+    function getAgentElement(id) {
+        const element = agentRegistry.elements.get(id)?.deref();
+        if (element?.isConnected) return element;
+        const entry = agentRegistry.ids.get(id);
+        if (!entry) return null;
+        // The node was re-rendered after the extraction, find its replacement by fingerprint
+        const candidates = Array.from(document.getElementsByTagName(entry.tag)).filter(candidate => getFingerprint(candidate) === entry.fingerprint);
+        // Several lookalikes: acting on a guess could hit the wrong one, the caller falls back to the xpath
+        if (candidates.length !== 1) return null;
+        const [candidate] = candidates;
+        candidate.setAttribute(AGENT_ID_ATTRIBUTE, id);
+        agentRegistry.elements.set(id, new WeakRef(candidate));
+        return candidate;
+    }
+
+// Typing strategy: the fields that react to key events get keystrokes, the rest are filled at once
+    const FILLABLE_INPUT_TYPES = new Set(['', 'text', 'search', 'email', 'url', 'tel', 'password', 'number']);
+    const MASK_PLACEHOLDER_PATTERN = /[_#]{2,}|(dd|mm|yy)[\/.-]|\(\s*[_#9]{3}\s*\)/i;
+
+    function getTypingStrategy(element) {
+        const attribute = name => (element.getAttribute(name) || '').toLowerCase();
+        if (element.isContentEditable) return 'type';
+        const tag = element.tagName.toLowerCase();
+        if (tag === 'input' && !FILLABLE_INPUT_TYPES.has(attribute('type'))) return 'type';
+        if (tag !== 'input' && tag !== 'textarea') return 'type';
+        // Autocomplete and comboboxes suggest as the user types
+        if (attribute('role') === 'combobox' || ['list', 'both', 'inline'].includes(attribute('aria-autocomplete'))) return 'type';
+        if (element.hasAttribute('list') || attribute('aria-haspopup') === 'listbox') return 'type';
+        // Masked inputs format the value keystroke by keystroke
+        if (element.getAttributeNames().some(name => name.includes('mask'))) return 'type';
+        if (MASK_PLACEHOLDER_PATTERN.test(attribute('placeholder'))) return 'type';
+        return 'fill';
+    }
+
 // Extract visible elements
-    async function getElements(node=document.body) {
-        const interactiveElements = [];
-        const informativeElements = [];
+    async function getElements(options = {}) {
+        const { incremental = false, columnar = false, maxTextLength = null, maxPageTextLength = null } = options;
         // Function to wait for the page to be fully loaded
         await waitForPageToLoad();
+        startJournal();
 
-        function isElementVisible(element) {
-            let type = element.getAttribute('type');
-            // The radio and checkbox elements are all ready invisible so we can skip them
-            if(new Set(['radio', 'checkbox']).has(type)) return true;
+        // Time spent per phase in milliseconds
+        const timings = { style: 0, text: 0, cover: 0, walk: 0, serialize: 0 };
+        const windowHeight = window.innerHeight || document.documentElement.clientHeight;
+        const windowWidth = window.innerWidth || document.documentElement.clientWidth;
+        const ALWAYS_VISIBLE_TYPES = new Set(['radio', 'checkbox']);
+        const CLIPPING_OVERFLOWS = new Set(['hidden', 'clip', 'scroll', 'auto']);
+
+        // Read the computed style and the rect of a node exactly once, every check below reuses them
+        function inspectLayout(element) {
+            const start = performance.now();
             const style = window.getComputedStyle(element);
-            const onScreen = element.offsetWidth > 0 && element.offsetHeight > 0;
+            const rect = element.getBoundingClientRect();
+            timings.style += performance.now() - start;
+            let text;
+            return {
+                style,
+                rect,
+                type: element.getAttribute('type'),
+                // innerText forces layout of the whole subtree, so it is read lazily and at most once
+                get text() {
+                    if (text === undefined) {
+                        const start = performance.now();
+                        text = element.innerText?.trim() ?? '';
+                        timings.text += performance.now() - start;
+                    }
+                    return text;
+                }
+            };
+        }
+
+        function isInViewport(rect) {
+            return rect.bottom >= 0 && rect.right >= 0 && rect.top <= windowHeight && rect.left <= windowWidth;
+        }
+
+        // A subtree can be skipped when none of its descendants can be rendered inside the viewport
+        function isPrunable(layout) {
+            const { style, rect } = layout;
+            if (style.display === 'none') return true;
+            if (style.display === 'contents' || style.position === 'fixed' || style.position === 'sticky') return false;
+            if (rect.width === 0 && rect.height === 0) return false;
+            if (isInViewport(rect)) return false;
+            // Descendants of an off-viewport box only stay off-viewport if the box clips them
+            return CLIPPING_OVERFLOWS.has(style.overflowX) && CLIPPING_OVERFLOWS.has(style.overflowY);
+        }
+
+        function isElementVisible(element, layout) {
+            // The radio and checkbox elements are all ready invisible so we can skip them
+            if(ALWAYS_VISIBLE_TYPES.has(layout.type)) return true;
+            const { style, rect } = layout;
             return style.display !== 'none' &&
             style.visibility !== 'hidden' &&
-            style.opacity !== '0' && 
+            style.opacity !== '0' &&
             !element.hasAttribute('hidden') &&
-            onScreen;
+            rect.width > 0 && rect.height > 0;
         }
 
-        function isElementInViewport(element) {
-            if (!element || element.offsetParent === null) {
-                return false; // Hidden elements (display: none)
-            }
-
-            const rect = element.getBoundingClientRect();
-            const style = window.getComputedStyle(element);
-            const windowHeight = window.innerHeight || document.documentElement.clientHeight;
-            const windowWidth = window.innerWidth || document.documentElement.clientWidth;
-        
+        function isElementInViewport(element, layout) {
+            const { style, rect } = layout;
             // Always consider fixed elements in the viewport if they have dimensions
             if (style.position === "fixed") {
                 return rect.width > 0 && rect.height > 0;
             }
+            // Hidden elements (display: none)
+            if (element.offsetParent === null) return false;
             // Sticky elements: Check if they are visible inside their parent
             if (style.position === "sticky") {
-                const parent = element.offsetParent;
-                if (parent) {
-                    const parentRect = parent.getBoundingClientRect();
-                    if (rect.bottom < parentRect.top || rect.top > parentRect.bottom) {
-                        return false; // Sticky element is outside its parent's view
-                    }
+                const parentRect = element.offsetParent.getBoundingClientRect();
+                if (rect.bottom < parentRect.top || rect.top > parentRect.bottom) {
+                    return false; // Sticky element is outside its parent's view
                 }
             }
             // Check if any part of the element is inside the viewport
-            return (
-                rect.bottom >= 0 &&
-                rect.right >= 0 &&
-                rect.top <= windowHeight &&
-                rect.left <= windowWidth
-            );
+            return isInViewport(rect);
         }
 
-        function isElementClickable(element) {
-            const style = window.getComputedStyle(element);
-            const isPointer = style.cursor === 'pointer';
+        function isElementClickable(element, layout) {
+            const isPointer = layout.style.cursor === 'pointer';
             const hasAttributeWithValue = (attr) => {
                 const value = element.getAttribute(attr);
                 return value !== null && value.trim().length > 0;
@@ -170,181 +381,282 @@ async function injectAllCSS() {
             return isClickable||isLink||isContentEditable||hasAttribute||hasEvents
         }
 
-        function isElementCovered(element) {
-            let type = element.getAttribute('type');
+        // Whether the walker descends into the children of the node
+        function isExplorable(element, layout) {
+            return !isElementClickable(element, layout) || EXPLORABLE_TAGS.has(element.tagName.toLowerCase());
+        }
+
+        function isElementCovered(element, layout) {
             // The radio and checkbox elements are all ready covered so we can skip them
-            if(new Set(['radio', 'checkbox']).has(type)) return false;
-            // Get the bounding box of the element to find its center point
-            const boundingBox = element.getBoundingClientRect();
-            const x = boundingBox.left + boundingBox.width / 2;
-            const y = boundingBox.top + boundingBox.height / 2;
+            if(ALWAYS_VISIBLE_TYPES.has(layout.type)) return false;
+            const start = performance.now();
             // Get the top element under the center of the current element
-            const topElement = document.elementFromPoint(x, y);
+            const { rect } = layout;
+            const topElement = document.elementFromPoint(rect.left + rect.width / 2, rect.top + rect.height / 2);
+            timings.cover += performance.now() - start;
             // If no element is found at the point, return false (no element is covering it)
             if (!topElement) return false;
-            // Compare if topElement is inside the current element
-            const isInside = element.contains(topElement);
             // If topElement is inside the current element, it means it's not covered by it
-            if (isInside) return false;        
-            return true;  // If no coverage, return true
+            return !element.contains(topElement);
         }
 
-        function traverseDom(currentNode) {
-            if (!currentNode) return;
-            if (currentNode.nodeType !== Node.ELEMENT_NODE) return;
+        function getBoundingBox(layout) {
+            const { rect } = layout;
+            let left = rect.left;
+            let top = rect.top;
+            let frame = window.frameElement;
+            // If the element is in an iframe, adjust the coordinates
+            while (frame!=null) {
+                let frameRect = frame.getBoundingClientRect();
+                left += frameRect.left;
+                top += frameRect.top;
+                frame = frame.ownerDocument.defaultView?.frameElement;
+            }
+            return { left, top, width: rect.width, height: rect.height };
+        }
 
+        // Inspect a single node, returns its interactive record, whether it may hold informative text and whether to descend
+        function inspectNode(currentNode, layout) {
+            const entry = { node: currentNode, rect: layout.rect, interactive: null, informative: null, textual: false, explorable: true };
             const tagName = currentNode.tagName.toLowerCase();
-            if (EXCLUDED_TAGS.has(tagName)) return;
-
             const role = currentNode.getAttribute('role');
             // Checks for standard and non-standard interactive elements
             const hasInteractiveTag = INTERACTIVE_TAGS.has(tagName) || tagName.split('-').some(part => INTERACTIVE_TAGS.has(part));
             const hasInteractiveRole = role && INTERACTIVE_ROLES.has(role);
+            const isClickableNode = isElementClickable(currentNode, layout);
+            entry.explorable = !isClickableNode || EXPLORABLE_TAGS.has(tagName);
+
+            const isVisible = isElementVisible(currentNode, layout) && isElementInViewport(currentNode, layout);
+            if (!isVisible) return entry;
 
             // Get Interactive Elements
-            const isClickable =isElementClickable(currentNode) || hasInteractiveTag || hasInteractiveRole
-            const isVisible = isElementVisible(currentNode) && isElementInViewport(currentNode)
-            if (isClickable && isVisible) {
+            if (isClickableNode || hasInteractiveTag || hasInteractiveRole) {
                 // Check if the element is covered by another element
-                const isCovered = !isElementCovered(currentNode);
-                if (isCovered) {
-                    const rect = currentNode.getBoundingClientRect();
-                    let left = rect.left;
-                    let top = rect.top;
-                    let width = rect.width;
-                    let height = rect.height;
-                    let frame = window.frameElement;
-                    // If the element is in an iframe, adjust the coordinates
-                    while (frame!=null) {
-                        let frameRect = frame.getBoundingClientRect();
-                        left += frameRect.left;
-                        top += frameRect.top;
-                        frame = frame.ownerDocument.defaultView?.frameElement;
-                    }
-                    const tagName = currentNode.tagName.toLowerCase();
-                    const boundingBox = { left, top, width, height };
+                if (!isElementCovered(currentNode, layout)) {
+                    const boundingBox = getBoundingBox(layout);
                     const x = Math.floor(boundingBox.left + boundingBox.width / 2);
                     const y = Math.floor(boundingBox.top + boundingBox.height / 2);
-                    const xpath=getXPath(currentNode)
-                    const role = currentNode.getAttribute('role') || 'none';
                     const name = currentNode.getAttribute('name') || currentNode.getAttribute('aria-label') || currentNode.getAttribute('title') ||
-                    currentNode.getAttribute('aria-labelledby') || currentNode.getAttribute('aria-describedby') || 
-                    currentNode.getAttribute('label') || currentNode.innerText?.trim() || 'none';
-                    if((role!=='none' || name!=='none')){
-                        interactiveElements.push({
+                    currentNode.getAttribute('aria-labelledby') || currentNode.getAttribute('aria-describedby') ||
+                    currentNode.getAttribute('label') || layout.text || 'none';
+                    if(((role && role!=='none') || name!=='none')){
+                        entry.interactive = {
                             tag: tagName,
-                            role: role,  // Default to 'none' if no role is found
-                            name: name, // Trim textContent if it exists
+                            role: role || 'none',  // Default to 'none' if no role is found
+                            name: truncateText(name), // Trim textContent if it exists
                             attributes: Object.fromEntries(
                                 Array.from(currentNode.attributes)
                                     .filter(attr => SAFE_ATTRIBUTES.has(attr.name))
                                     .map(attr => [attr.name, attr.value])),
-                            box: boundingBox || null,  // Avoid undefined errors
+                            box: boundingBox,
                             center: { x, y },
-                            xpath: xpath
-                        });
+                            id: stampAgentId(currentNode)
+                        };
                     }
                 }
             }
+
+            // Informative Elements get their text once the children are walked
             const hasInformativeTag = INFORMATIVE_TAGS.has(tagName);
             const hasInformativeRole = role && INFORMATIVE_ROLES.has(role);
-            const hasContent = currentNode.innerText?.trim()!==''
+            entry.textual = (hasInformativeTag || hasInformativeRole) && !isClickableNode;
+            return entry;
+        }
 
-            // Get Informative Elements
-            const isTextual = ((hasInformativeTag || hasInformativeRole) && hasContent) && !isElementClickable(currentNode)
-            if (isTextual && isVisible) {
-                // Check if the element is covered by another element
-                const isCovered = !isElementCovered(currentNode);
-                if (isCovered) {
-                    const rect = currentNode.getBoundingClientRect();
-                    let left = rect.left;
-                    let top = rect.top;
-                    let width = rect.width;
-                    let height = rect.height;
-                    let frame = window.frameElement;
-                    // If the element is in an iframe, adjust the coordinates
-                    while (frame!=null) {
-                        let frameRect = frame.getBoundingClientRect();
-                        left += frameRect.left;
-                        top += frameRect.top;
-                        frame = frame.ownerDocument.defaultView?.frameElement;
-                    }
-                    const boundingBox = { left, top, width, height };
-                    const x = Math.floor(boundingBox.left + boundingBox.width / 2);
-                    const y = Math.floor(boundingBox.top + boundingBox.height / 2);
-                    const xpath=getXPath(currentNode)
-                    informativeElements.push({
-                        tag: currentNode.tagName.toLowerCase(),
-                        role: role,
-                        content: currentNode.innerText?.trim(),
-                        center:{x,y},
-                        xpath: xpath
-                    });
-                }
-            }
+        function truncateText(text) {
+            if (maxTextLength === null || text.length <= maxTextLength) return text;
+            return text.slice(0, maxTextLength) + '…';
+        }
+
+        // Report the text at the node as an informative element, returns whether the text was claimed
+        function claimText(entry, layout, text) {
+            const content = text.replace(/\s+/g, ' ').trim();
+            if (!content) return false;
+            // Check if the element is covered by another element
+            if (isElementCovered(entry.node, layout)) return false;
+            const boundingBox = getBoundingBox(layout);
+            const x = Math.floor(boundingBox.left + boundingBox.width / 2);
+            const y = Math.floor(boundingBox.top + boundingBox.height / 2);
+            entry.informative = {
+                tag: entry.node.tagName.toLowerCase(),
+                role: entry.node.getAttribute('role'),
+                content: truncateText(content),
+                center:{x,y}
+            };
+            return true;
+        }
+
+        // Walk the subtree, the text runs not yet claimed by a descendant are collected in parts
+        function traverseDom(currentNode, entries, parts) {
+            if (!currentNode) return;
+            if (currentNode.nodeType !== Node.ELEMENT_NODE) return;
+
+            const tagName = currentNode.tagName.toLowerCase();
+            if (EXCLUDED_TAGS.has(tagName)) return;
+
+            const layout = inspectLayout(currentNode);
+            if (isPrunable(layout)) return;
+            const entry = inspectNode(currentNode, layout);
+            // The entry is placed before its descendants to keep the document order
+            entries.push(entry);
+            const start = parts.length;
             
             // Handle shadow DOM
             const shadowRoot=currentNode.shadowRoot
             if(shadowRoot){
-                Array.from(shadowRoot.children).forEach(child => traverseDom(child));
+                // The journal does not see the mutations inside the shadow roots, such a page is walked in full every time
+                hasShadowRoots = true;
+                for (const child of shadowRoot.children) traverseDom(child, entries, parts);
             }
-            if(!isElementClickable(currentNode)||EXPLORABLE_TAGS.has(tagName)){
-                Array.from(currentNode.children).forEach(child => traverseDom(child));
+            if(entry.explorable){
+                const hasOwnText = layout.style.visibility !== 'hidden';
+                for (const child of currentNode.childNodes) {
+                    if (child.nodeType === Node.TEXT_NODE) {
+                        if (hasOwnText) parts.push(child.data);
+                    } else {
+                        traverseDom(child, entries, parts);
+                    }
+                }
+            }
+            // The text of an interactive element is already reported as its name
+            if (entry.interactive) {
+                parts.length = start;
+            } else if (entry.textual && parts.length > start) {
+                // Each text run is reported once, by the most specific informative element holding it
+                if (claimText(entry, layout, parts.slice(start).join(' '))) parts.length = start;
             }
         }
-        traverseDom(node);
-    return {interactiveElements,informativeElements};
-    }
 
-    // Mark page by placing bounding boxes and labels
-    function mark_page(boxes) {
-        // Function to generate a random color
-        function getRandomColor() {
-            const letters = '0123456789ABCDEF';
-            let color = '#';
-            for (let i = 0; i < 6; i++) {
-                color += letters[Math.floor(Math.random() * 16)];
+        // Lift a dirty node to the highest ancestor the walker would not have descended past, or that claimed its text
+        function getDirtyRoot(node, claimed) {
+            let root = node;
+            for (let ancestor = node.parentElement; ancestor && ancestor !== document.body; ancestor = ancestor.parentElement) {
+                const tagName = ancestor.tagName.toLowerCase();
+                if (EXCLUDED_TAGS.has(tagName) || claimed.has(ancestor) || !isExplorable(ancestor, inspectLayout(ancestor))) {
+                    root = ancestor;
+                }
             }
-            return color;
+            return root;
         }
-        boxes.forEach((box,index) => {
-            const { left, top, width, height } = box;
-            const color = getRandomColor();
-
-            // Create bounding box
-            const boundingBox = document.createElement('div');
-            boundingBox.style.position = 'fixed';
-            boundingBox.style.left = `${left}px`;
-            boundingBox.style.top = `${top}px`;
-            boundingBox.style.width = `${width}px`;
-            boundingBox.style.height = `${height}px`;
-            boundingBox.style.outline = `2px solid ${color}`;
-            boundingBox.style.pointerEvents = 'none';
-            boundingBox.style.zIndex = '9999';
-
-            // Create a label for numbering
-            const label = document.createElement('span');
-            label.textContent = index;
-            label.style.position = 'absolute';
-            label.style.top = '-19px';
-            label.style.right = '0px';
-            label.style.backgroundColor = color;
-            label.style.color = 'white';
-            label.style.padding = '2px 4px';
-            label.style.fontSize = '12px';
-            label.style.borderRadius = '2px';
-
-            // Append label and bounding box
-            boundingBox.appendChild(label);
-            labels.push(boundingBox);
-            document.body.appendChild(boundingBox);
-        });
+
+        // Cap the text sent for the whole document, in document order
+        function capPageText(elements) {
+            if (maxPageTextLength === null) return elements;
+            const capped = [];
+            let remaining = maxPageTextLength;
+            for (const element of elements) {
+                if (remaining <= 0) break;
+                const content = element.content;
+                capped.push(content.length > remaining ? { ...element, content: content.slice(0, remaining) + '…' } : element);
+                remaining -= content.length;
+            }
+            return capped;
+        }
+
+        function getViewport() {
+            return {
+                url: location.href,
+                scrollX: window.scrollX,
+                scrollY: window.scrollY,
+                width: window.innerWidth,
+                height: window.innerHeight
+            };
+        }
+
+        function canMerge(viewport) {
+            const snapshot = journal.snapshot;
+            if (!incremental || !snapshot || journal.overflow || snapshot.hasShadowRoots) return false;
+            return ['url', 'scrollX', 'scrollY', 'width', 'height'].every(key => snapshot.viewport[key] === viewport[key]);
+        }
+
+        function isSameRect(a, b) {
+            return a.left === b.left && a.top === b.top && a.width === b.width && a.height === b.height;
+        }
+
+        function isOverlapping(a, b) {
+            return a.left < b.right && b.left < a.right && a.top < b.bottom && b.top < a.bottom;
+        }
+
+        const walkStart = performance.now();
+        const viewport = getViewport();
+        let entries = [];
+        let hasShadowRoots = false;
+        const merge = canMerge(viewport);
+        if (merge) {
+            // Only the changed subtrees are walked, the rest of the previous entries are kept unless the change moved or overlaps them
+            const roots = [];
+            const claimed = new Set(journal.snapshot.entries.filter(entry => entry.informative).map(entry => entry.node));
+            for (const node of journal.dirty) {
+                if (!node.isConnected || !document.body.contains(node)) continue;
+                const root = getDirtyRoot(node, claimed);
+                if (!roots.includes(root)) roots.push(root);
+            }
+            const topRoots = roots.filter(root => !roots.some(other => other !== root && other.contains(root)));
+            const dirtyRects = topRoots.map(root => root.getBoundingClientRect());
+            for (const previous of journal.snapshot.entries) {
+                const node = previous.node;
+                if (!node.isConnected || topRoots.some(root => root.contains(node))) continue;
+                // The rect is cheap once the layout is clean, the style, the text and the hit test are not
+                const rect = node.getBoundingClientRect();
+                if (isSameRect(rect, previous.rect) && !dirtyRects.some(dirtyRect => isOverlapping(rect, dirtyRect))) {
+                    entries.push(previous);
+                    continue;
+                }
+                const layout = inspectLayout(node);
+                const entry = inspectNode(node, layout);
+                if (entry.textual && previous.informative) {
+                    claimText(entry, layout, previous.informative.content);
+                }
+                entries.push(entry);
+            }
+            topRoots.forEach(root => traverseDom(root, entries, []));
+            // Keep the records in document order so the element indices stay stable
+            entries.sort((a, b) => a.node === b.node ? 0 : (a.node.compareDocumentPosition(b.node) & Node.DOCUMENT_POSITION_FOLLOWING ? -1 : 1));
+        } else {
+            traverseDom(document.body, entries, []);
+        }
+        entries = entries.filter(entry => entry.interactive || entry.informative);
+        journal.dirty.clear();
+        journal.overflow = false;
+        journal.snapshot = { viewport, entries, hasShadowRoots };
+        timings.walk = performance.now() - walkStart;
+
+        const serializeStart = performance.now();
+        // The xpath is read at the end, a merge may have moved the kept entries; it is the fallback when the agent id has no single match
+        let interactiveElements = entries.filter(entry => entry.interactive).map(entry => ({ ...entry.interactive, xpath: getXPath(entry.node) }));
+        let informativeElements = capPageText(entries.filter(entry => entry.informative).map(entry => entry.informative));
+        if (columnar) {
+            interactiveElements = toInteractiveColumns(interactiveElements);
+            informativeElements = toInformativeColumns(informativeElements);
+        }
+        timings.serialize = performance.now() - serializeStart;
+        return { interactiveElements, informativeElements, timings };
     }
 
-    // Remove all bounding boxes and labels
-    function unmark_page() {
-        for (const label of labels) {
-            document.body.removeChild(label);
+    // Columnar wire format: parallel arrays per field with the coordinates packed as flat int arrays
+    function toInteractiveColumns(elements) {
+        const columns = { tag: [], role: [], name: [], attributes: [], id: [], xpath: [], box: [], center: [] };
+        for (const element of elements) {
+            const { left, top, width, height } = element.box;
+            columns.tag.push(element.tag);
+            columns.role.push(element.role);
+            columns.name.push(element.name);
+            columns.attributes.push(element.attributes);
+            columns.id.push(element.id);
+            columns.xpath.push(element.xpath);
+            columns.box.push(Math.round(left), Math.round(top), Math.round(width), Math.round(height));
+            columns.center.push(element.center.x, element.center.y);
         }
-        labels.length = 0;
-    }
\ No newline at end of file
+        return columns;
+    }
+
+    function toInformativeColumns(elements) {
+        const columns = { tag: [], role: [], content: [], center: [] };
+        for (const element of elements) {
+            columns.tag.push(element.tag);
+            columns.role.push(element.role);
+            columns.content.push(element.content);
+            columns.center.push(element.center.x, element.center.y);
+        }
+        return columns;
+    }
@@ -0,0 +1,104 @@
+from src.agent.web.dom.views import DOMState, DOMElementNode, DOMTextualNode
+from collections import Counter
+from math import log
+import re
+
+# Attributes that rarely help the LLM choose an element and are capped hard
+LONG_ATTRIBUTES = {'class':40,'href':80,'data-testid':40,'data-id':40,'data-qa':40,'data-cy':40}
+MAX_ATTRIBUTE_LENGTH = 100
+# Share of the token budget given to the interactive elements, the rest goes to the informative ones
+INTERACTIVE_SHARE = 0.6
+
+def tokenize(text:str)->list[str]:
+    return re.findall(r'[a-z0-9]+',text.lower())
+
+def estimate_tokens(text:str)->int:
+    '''Rough token count, about 4 characters per token'''
+    return len(text)//4+1
+
+class BM25:
+    '''Okapi BM25 over a small in-memory corpus'''
+    def __init__(self,documents:list[list[str]],k1:float=1.5,b:float=0.75):
+        self.k1=k1
+        self.b=b
+        self.frequencies=[Counter(document) for document in documents]
+        self.lengths=[len(document) for document in documents]
+        self.average_length=(sum(self.lengths)/len(documents)) if documents else 0
+        document_frequency=Counter(term for document in documents for term in set(document))
+        total=len(documents)
+        self.idf={term:log(1+(total-count+0.5)/(count+0.5)) for term,count in document_frequency.items()}
+
+    def scores(self,query:list[str])->list[float]:
+        terms=set(query)
+        scores=[]
+        for frequencies,length in zip(self.frequencies,self.lengths):
+            score=0.0
+            for term in terms:
+                frequency=frequencies.get(term)
+                if not frequency:
+                    continue
+                norm=self.k1*(1-self.b+self.b*length/(self.average_length or 1))
+                score+=self.idf[term]*frequency*(self.k1+1)/(frequency+norm)
+            scores.append(score)
+        return scores
+
+def trim_attributes(attributes:dict[str,str])->dict[str,str]:
+    trimmed={}
+    for key,value in attributes.items():
+        limit=LONG_ATTRIBUTES.get(key,MAX_ATTRIBUTE_LENGTH)
+        trimmed[key]=value if len(value)<=limit else f'{value[:limit]}…'
+    return trimmed
+
+def interactive_line(index:int,node:DOMElementNode)->str:
+    return f'{index} - Tag: {node.tag} Role: {node.role} Name: {node.name} Attributes: {trim_attributes(node.attributes)} Cordinates: {node.center.to_string()}'
+
+def informative_line(node:DOMTextualNode)->str:
+    return f'Tag: {node.tag} Role: {node.role} Content: {node.content} Cordinates: {node.center.to_string()}'
+
+def select(lines:list[str],documents:list[list[str]],query:list[str],token_budget:int)->set[int]:
+    '''Pick the most relevant lines that fit in the budget, ties keep the page order'''
+    scores=BM25(documents).scores(query) if query else [0.0]*len(lines)
+    ranking=sorted(range(len(lines)),key=lambda i:(-scores[i],i))
+    selected,used=set(),0
+    for i in ranking:
+        tokens=estimate_tokens(lines[i])
+        if used+tokens>token_budget:
+            continue
+        selected.add(i)
+        used+=tokens
+    return selected
+
+def serialize_interactive(nodes:list[DOMElementNode],query:list[str],token_budget:int)->str:
+    lines=[interactive_line(index,node) for index,node in enumerate(nodes)]
+    documents=[tokenize(f'{node.tag} {node.role} {node.name} {" ".join(node.attributes.values())}') for node in nodes]
+    selected=select(lines,documents,query,token_budget)
+    output=[line for i,line in enumerate(lines) if i in selected]
+    omitted=Counter(node.role if node.role!='none' else node.tag for i,node in enumerate(nodes) if i not in selected)
+    if omitted:
+        # The indices of the listed elements stay the selector map indices, the rest is only counted
+        summary=', '.join(f'{count} {kind}' for kind,count in omitted.most_common())
+        output.append(f'[{sum(omitted.values())} less relevant elements omitted: {summary}]')
+    return '\n'.join(output)
+
+def serialize_informative(nodes:list[DOMTextualNode],query:list[str],token_budget:int)->str:
+    lines=[informative_line(node) for node in nodes]
+    documents=[tokenize(node.content) for node in nodes]
+    selected=select(lines,documents,query,token_budget)
+    output=[line for i,line in enumerate(lines) if i in selected]
+    omitted=Counter(node.tag for i,node in enumerate(nodes) if i not in selected)
+    if omitted:
+        summary=', '.join(f'{count} {kind}' for kind,count in omitted.most_common())
+        output.append(f'[{sum(omitted.values())} less relevant text blocks omitted: {summary}]')
+    return '\n'.join(output)
+
+def serialize_state(dom_state:DOMState,query:str,token_budget:int)->tuple[str,str]:
+    '''Serialize the interactive and informative elements within a token budget, ranked by their BM25 relevance to the query.'''
+    if dom_state.outline is not None:
+        return dom_state.interactive_elements_to_string(),dom_state.informative_elements_to_string()
+    query_terms=tokenize(query)
+    interactive_budget=int(token_budget*INTERACTIVE_SHARE)
+    interactive_elements=serialize_interactive(dom_state.interactive_nodes,query_terms,interactive_budget)
+    # The budget left over by the interactive elements goes to the informative ones
+    informative_budget=token_budget-estimate_tokens(interactive_elements)
+    informative_elements=serialize_informative(dom_state.informative_nodes,query_terms,informative_budget)
+    return interactive_elements,informative_elements
@@ -0,0 +1,253 @@
+from src.agent.web.dom.config import INTERACTIVE_TAGS,INFORMATIVE_TAGS,EXPLORABLE_TAGS,EXCLUDED_TAGS,INTERACTIVE_ROLES,INFORMATIVE_ROLES,SAFE_ATTRIBUTES,CLICK_ATTRIBUTES,EVENT_ATTRIBUTES,LINK_ATTRIBUTES,DATA_ATTRIBUTES,NAME_ATTRIBUTES,COMPUTED_STYLES,SHADOW_ROOT_STEP
+from src.agent.web.dom.views import DOMElementNode, DOMTextualNode, CenterCord, BoundingBox
+from playwright.async_api import Page, Frame
+from typing import TYPE_CHECKING
+from src.agent.web.dom import DOM
+from time import perf_counter
+from asyncio import gather
+import re
+
+if TYPE_CHECKING:
+    from src.agent.web.context import Context
+
+ELEMENT_NODE=1
+TEXT_NODE=3
+SHADOW_ROOT_NODE=11
+
+class SnapshotDOM(DOM):
+    '''Extracts the DOM state from a single CDP DOMSnapshot.captureSnapshot call (Chromium only), the nodes are resolved by their xpath.'''
+    async def get_elements(self,frames:list[Frame|Page])->tuple[list[DOMElementNode],list[DOMTextualNode],dict[str,float],dict[str,Frame]]:
+        if self.context.browser.config.browser=='firefox':
+            return await super().get_elements(frames=frames)
+        page=await self.context.get_current_page()
+        start=perf_counter()
+        session=await page.context.new_cdp_session(page)
+        try:
+            snapshot,metrics=await gather(
+                session.send('DOMSnapshot.captureSnapshot',{'computedStyles':COMPUTED_STYLES,'includeDOMRects':True}),
+                session.send('Page.getLayoutMetrics')
+            )
+        finally:
+            await session.detach()
+        capture=(perf_counter()-start)*1000
+        start=perf_counter()
+        viewport=metrics.get('cssLayoutViewport')
+        parser=SnapshotParser(snapshot=snapshot,width=viewport.get('clientWidth'),height=viewport.get('clientHeight'),context=self.context)
+        interactive_elements,informative_elements=parser.parse()
+        timings={'capture':capture,'parse':(perf_counter()-start)*1000}
+        return interactive_elements,self.cap_text(informative_elements),timings,{}
+
+class SnapshotParser:
+    '''Post-processes a DOMSnapshot into the nodes, applying the same rules as the walker in script.js.'''
+    def __init__(self,snapshot:dict,width:int,height:int,context:'Context'):
+        self.strings:list[str]=snapshot.get('strings')
+        self.documents:list[dict]=snapshot.get('documents')
+        self.width=width
+        self.height=height
+        self.context=context
+        self.max_text_length=context.config.max_text_length
+        self.interactive_elements:list[DOMElementNode]=[]
+        self.informative_elements:list[DOMTextualNode]=[]
+
+    def parse(self)->tuple[list[DOMElementNode],list[DOMTextualNode]]:
+        if self.documents:
+            DocumentParser(self,index=0,left=0,top=0,frame_xpath='').parse()
+        return self.interactive_elements,self.informative_elements
+
+    def string(self,index:int)->str:
+        return self.strings[index] if index>=0 else ''
+
+    def truncate(self,text:str)->str:
+        if self.max_text_length is None or len(text)<=self.max_text_length:
+            return text
+        return f'{text[:self.max_text_length]}…'
+
+class DocumentParser:
+    '''Parses one document of the snapshot, the documents of the visible iframes are parsed in place.'''
+    def __init__(self,parser:SnapshotParser,index:int,left:float,top:float,frame_xpath:str):
+        self.parser=parser
+        self.left=left
+        self.top=top
+        self.frame_xpath=frame_xpath
+        document=parser.documents[index]
+        nodes=document.get('nodes')
+        layout=document.get('layout')
+        self.scroll_x=document.get('scrollOffsetX',0)
+        self.scroll_y=document.get('scrollOffsetY',0)
+        self.parent_index:list[int]=nodes.get('parentIndex')
+        self.node_type:list[int]=nodes.get('nodeType')
+        self.node_name:list[int]=nodes.get('nodeName')
+        self.node_value:list[int]=nodes.get('nodeValue')
+        self.attributes:list[list[int]]=nodes.get('attributes')
+        self.backend_node_id:list[int]=nodes.get('backendNodeId',[])
+        self.clickable=set(nodes.get('isClickable',{}).get('index',[]))
+        content_documents=nodes.get('contentDocumentIndex',{})
+        self.content_documents=dict(zip(content_documents.get('index',[]),content_documents.get('value',[])))
+        self.children:list[list[int]]=[[] for _ in self.parent_index]
+        for node,parent in enumerate(self.parent_index):
+            if parent>=0:
+                self.children[parent].append(node)
+        # A node can own several layout objects, the first one is its box
+        self.layout:dict[int,int]={}
+        for layout_index,node in enumerate(layout.get('nodeIndex')):
+            self.layout.setdefault(node,layout_index)
+        self.styles:list[list[int]]=layout.get('styles')
+        self.bounds:list[list[float]]=layout.get('bounds')
+        self.positions:dict[int,int]={}
+
+    def parse(self):
+        self.traverse(0,[])
+
+    def tag(self,node:int)->str:
+        return self.parser.string(self.node_name[node]).lower()
+
+    def get_attributes(self,node:int)->dict[str,str]:
+        values=self.attributes[node]
+        return {self.parser.string(values[i]):self.parser.string(values[i+1]) for i in range(0,len(values)-1,2)}
+
+    def get_style(self,node:int)->dict[str,str]|None:
+        layout_index=self.layout.get(node)
+        if layout_index is None:
+            return None
+        return dict(zip(COMPUTED_STYLES,map(self.parser.string,self.styles[layout_index])))
+
+    def get_rect(self,node:int)->tuple[float,float,float,float]|None:
+        '''The box of the node in the coordinates of the top level viewport'''
+        layout_index=self.layout.get(node)
+        if layout_index is None:
+            return None
+        x,y,width,height=self.bounds[layout_index]
+        return (x-self.scroll_x+self.left,y-self.scroll_y+self.top,width,height)
+
+    def get_xpath(self,node:int)->str:
+        '''The xpath of the node in its document, a shadow root is crossed through its host'''
+        parts=[]
+        while node>=0 and self.node_type[node] in (ELEMENT_NODE,SHADOW_ROOT_NODE):
+            parent=self.parent_index[node]
+            if self.node_type[node]==SHADOW_ROOT_NODE:
+                parts.append(SHADOW_ROOT_STEP)
+                node=parent
+                continue
+            if node not in self.positions and parent>=0:
+                # Positions are computed for all the siblings at once
+                counts={}
+                for sibling in self.children[parent]:
+                    if self.node_type[sibling]==ELEMENT_NODE:
+                        name=self.node_name[sibling]
+                        counts[name]=counts.get(name,0)+1
+                        self.positions[sibling]=counts[name]
+            parts.append(f'{self.tag(node)}[{self.positions.get(node,1)}]')
+            node=parent
+        return '/'+'/'.join(reversed(parts))
+
+    def is_visible(self,attributes:dict[str,str],style:dict[str,str]|None,rect:tuple|None)->bool:
+        if style is None or rect is None:
+            return False
+        left,top,width,height=rect
+        # The radio and checkbox elements are all ready invisible so we can skip them
+        if attributes.get('type') not in ('radio','checkbox'):
+            if any([style.get('display')=='none',style.get('visibility')=='hidden',style.get('opacity')=='0','hidden' in attributes,width<=0,height<=0]):
+                return False
+        if style.get('position')=='fixed':
+            return width>0 and height>0
+        return left+width>=0 and top+height>=0 and left<=self.parser.width and top<=self.parser.height
+
+    def is_clickable(self,node:int,attributes:dict[str,str],style:dict[str,str]|None)->bool:
+        has_value=lambda attribute: attributes.get(attribute,'').strip()!=''
+        if style is not None and style.get('cursor')=='pointer':
+            return True
+        if node in self.clickable or 'contenteditable' in attributes:
+            return True
+        return any(map(has_value,CLICK_ATTRIBUTES+EVENT_ATTRIBUTES+LINK_ATTRIBUTES+DATA_ATTRIBUTES))
+
+    def get_text(self,node:int)->str:
+        '''The rendered text of the subtree'''
+        parts=[]
+        stack=[node]
+        while stack:
+            current=stack.pop()
+            if self.node_type[current]==TEXT_NODE:
+                if current in self.layout:
+                    parts.append(self.parser.string(self.node_value[current]))
+            else:
+                stack.extend(reversed(self.children[current]))
+        return re.sub(r'\s+',' ',' '.join(parts)).strip()
+
+    def traverse(self,node:int,parts:list[str]):
+        '''Walk the subtree, the text runs not yet claimed by a descendant are collected in parts'''
+        node_type=self.node_type[node]
+        if node_type==TEXT_NODE:
+            if node in self.layout:
+                parts.append(self.parser.string(self.node_value[node]))
+            return
+        if node_type!=ELEMENT_NODE:
+            # Documents and shadow roots
+            for child in self.children[node]:
+                self.traverse(child,parts)
+            return
+        tag=self.tag(node)
+        if tag in EXCLUDED_TAGS:
+            return
+        attributes=self.get_attributes(node)
+        role=attributes.get('role')
+        style=self.get_style(node)
+        rect=self.get_rect(node)
+        is_visible=self.is_visible(attributes,style,rect)
+        is_clickable=self.is_clickable(node,attributes,style)
+        has_interactive_tag=tag in INTERACTIVE_TAGS or any(part in INTERACTIVE_TAGS for part in tag.split('-'))
+        is_interactive=False
+        if is_visible and (is_clickable or has_interactive_tag or role in INTERACTIVE_ROLES):
+            name=next((attributes.get(attribute) for attribute in NAME_ATTRIBUTES if attributes.get(attribute)),None) or self.get_text(node) or 'none'
+            if (role and role!='none') or name!='none':
+                is_interactive=True
+                self.parser.interactive_elements.append(self.element_node(node,tag,role,name,attributes,rect))
+        start=len(parts)
+        # The informative node goes before the ones of its descendants to keep the document order
+        position=len(self.parser.informative_elements)
+        if node in self.content_documents:
+            self.parse_frame(node,rect)
+        if not is_clickable or tag in EXPLORABLE_TAGS:
+            for child in self.children[node]:
+                self.traverse(child,parts)
+        # The text of an interactive element is already reported as its name
+        if is_interactive:
+            del parts[start:]
+        elif is_visible and (tag in INFORMATIVE_TAGS or role in INFORMATIVE_ROLES) and not is_clickable:
+            # Each text run is reported once, by the most specific informative element holding it
+            content=re.sub(r'\s+',' ',' '.join(parts[start:])).strip()
+            if content:
+                del parts[start:]
+                self.parser.informative_elements.insert(position,self.textual_node(tag,role,content,rect))
+
+    def parse_frame(self,node:int,rect:tuple|None):
+        document_index=self.content_documents.get(node)
+        url=self.parser.documents[document_index].get('documentURL','')
+        if rect is None or self.parser.context.is_ad_url(url):
+            return None
+        left,top,width,height=rect
+        if left<0 or top<0 or width*height<10:
+            return None
+        # As with the script engine the frame xpath is relative to the parent document
+        DocumentParser(self.parser,index=document_index,left=left,top=top,frame_xpath=self.get_xpath(node)).parse()
+
+    def element_node(self,node:int,tag:str,role:str|None,name:str,attributes:dict[str,str],rect:tuple)->DOMElementNode:
+        left,top,width,height=rect
+        return DOMElementNode(**{
+            'tag':tag,
+            'role':role or 'none',
+            'name':self.parser.truncate(name),
+            'attributes':{key:value for key,value in attributes.items() if key in SAFE_ATTRIBUTES},
+            'center':CenterCord(x=int(left+width/2),y=int(top+height/2)),
+            'bounding_box':BoundingBox(left=round(left),top=round(top),width=round(width),height=round(height)),
+            'xpath':{'frame':self.frame_xpath,'element':self.get_xpath(node)}
+        })
+
+    def textual_node(self,tag:str,role:str|None,content:str,rect:tuple)->DOMTextualNode:
+        left,top,width,height=rect
+        return DOMTextualNode(**{
+            'tag':tag,
+            'role':role,
+            'content':self.parser.truncate(content),
+            'center':CenterCord(x=int(left+width/2),y=int(top+height/2)),
+            'xpath':{'frame':self.frame_xpath,'element':''}
+        })
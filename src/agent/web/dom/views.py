@@ -1,5 +1,7 @@
 from dataclasses import dataclass,field
-@dataclass
+from playwright.async_api import Frame
+
+@dataclass(slots=True)
 class BoundingBox:
     left:int
     top:int
@@ -12,7 +14,7 @@ class BoundingBox:
     def to_dict(self):
         return {'left':self.left,'top':self.top,'width':self.width,'height':self.height}
 
-@dataclass
+@dataclass(slots=True)
 class CenterCord:
     x:int
     y:int
@@ -23,7 +25,7 @@ class CenterCord:
     def to_dict(self):
         return {'x':self.x,'y':self.y}
 
-@dataclass
+@dataclass(slots=True)
 class DOMElementNode:
     tag: str
     role: str
@@ -32,14 +34,22 @@ class DOMElementNode:
     center: CenterCord
     attributes: dict[str,str] = field(default_factory=dict)
     xpath: dict[str,str]=field(default_factory=dict)
+    agent_id: str|None = None
 
     def __repr__(self):
-        return f"DOMElementNode(tag='{self.tag}', role='{self.role}', name='{self.name}', attributes={self.attributes}, cordinates={self.center}, bounding_box={self.bounding_box}, xpath='{self.xpath}')"
+        return f"DOMElementNode(tag='{self.tag}', role='{self.role}', name='{self.name}', attributes={self.attributes}, cordinates={self.center}, bounding_box={self.bounding_box}, xpath='{self.xpath}', agent_id='{self.agent_id}')"
     
     def to_dict(self)->dict[str,str]:
         return {'tag':self.tag,'role':self.role,'name':self.name,'bounding_box':self.bounding_box.to_dict(),'attributes':self.attributes, 'cordinates':self.center.to_dict()}
 
-@dataclass
+    @staticmethod
+    def from_columns(columns:dict[str,list],frame_xpath:str='')->list['DOMElementNode']:
+        '''Build the nodes from the columnar payload of getElements, coordinates are packed as flat int arrays.'''
+        box,center=columns.get('box'),columns.get('center')
+        return [DOMElementNode(tag,role,name,BoundingBox(*box[i*4:i*4+4]),CenterCord(*center[i*2:i*2+2]),attributes,{'frame':frame_xpath,'element':xpath},agent_id)
+        for i,(tag,role,name,attributes,agent_id,xpath) in enumerate(zip(columns.get('tag'),columns.get('role'),columns.get('name'),columns.get('attributes'),columns.get('id'),columns.get('xpath')))]
+
+@dataclass(slots=True)
 class DOMTextualNode:
     tag:str
     role:str
@@ -53,15 +63,30 @@ class DOMTextualNode:
     def to_dict(self)->dict[str,str]:
         return {'tag':self.tag,'role':self.role,'content':self.content, 'center':self.center.to_dict()}
 
+    @staticmethod
+    def from_columns(columns:dict[str,list],frame_xpath:str='')->list['DOMTextualNode']:
+        '''Build the nodes from the columnar payload of getElements, coordinates are packed as flat int arrays.'''
+        center=columns.get('center')
+        return [DOMTextualNode(tag,role,content,CenterCord(*center[i*2:i*2+2]),{'frame':frame_xpath,'element':''})
+        for i,(tag,role,content) in enumerate(zip(columns.get('tag'),columns.get('role'),columns.get('content')))]
+
 @dataclass
 class DOMState:
     interactive_nodes: list[DOMElementNode]=field(default_factory=list)
     informative_nodes:list[DOMTextualNode]=field(default_factory=list)
     selector_map: dict[str,DOMElementNode]=field(default_factory=dict)
+    timings: dict[str,float]=field(default_factory=dict)
+    frames: dict[str,Frame]=field(default_factory=dict)
+    outline: str|None=None
 
     def interactive_elements_to_string(self)->str:
+        # The accessibility outline numbers the interactive elements and carries the text in place
+        if self.outline is not None:
+            return self.outline
         return '\n'.join([f'{index} - Tag: {node.tag} Role: {node.role} Name: {node.name} Attributes: {node.attributes} Cordinates: {node.center.to_string()}' for index,(node) in enumerate(self.interactive_nodes)])
     
     def informative_elements_to_string(self)->str:
+        if self.outline is not None:
+            return 'Included in the accessibility outline above.'
         return  '\n'.join([f'Tag: {node.tag} Role: {node.role} Content: {node.content} Cordinates: {node.center.to_string()}' for node in self.informative_nodes])
     
@@ -0,0 +1,216 @@
+from dataclasses import dataclass
+from asyncio import Semaphore,create_task,gather,to_thread
+from typing import Callable
+from time import perf_counter
+from hashlib import sha256
+from pathlib import Path
+from os import replace
+import httpx
+import json
+
+CHUNK_SIZE=1024*1024
+# The callback hears of a running download at most this often, in seconds
+PROGRESS_INTERVAL=1
+# Files past this size are fetched in parallel segments when the server accepts ranges
+SEGMENT_THRESHOLD=64*1024*1024
+
+@dataclass
+class DownloadResult:
+    path:Path
+    size:int
+    duration:float
+    sha256:str
+    resumed:bool=False
+    segments:int=1
+
+    @property
+    def throughput(self)->float:
+        return self.size/self.duration if self.duration>0 else 0.0
+
+    def to_string(self)->str:
+        return f'{format_size(self.size)} in {self.duration:.1f}s ({format_size(self.throughput)}/s{", resumed" if self.resumed else ""}), sha256 {self.sha256}'
+
+def format_size(size:float)->str:
+    for unit in ['B','KB','MB','GB']:
+        if size<1024 or unit=='GB':
+            return f'{size:.1f} {unit}'
+        size/=1024
+
+def hash_file(path:Path):
+    digest=sha256()
+    with open(path,'rb') as f:
+        while chunk:=f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest
+
+class DownloadManager:
+    '''Streams downloads to disk off the event loop, resumes the interrupted ones with HTTP Range and fetches the large ones in parallel segments.'''
+    def __init__(self,max_downloads:int=3,segments:int=4,on_progress:Callable[[str,int,int|None],None]=None):
+        self.semaphore=Semaphore(max_downloads)
+        self.segments=segments
+        self.on_progress=on_progress
+        self.client:httpx.AsyncClient=None
+        # Bytes done and total size of the running downloads by url, and when the callback last heard of them
+        self.progress:dict[str,tuple[int,int|None]]={}
+        self.reported:dict[str,float]={}
+
+    def get_client(self)->httpx.AsyncClient:
+        if self.client is None or self.client.is_closed:
+            # The bytes are written as they come, a compressed answer would land on disk compressed and break the offsets
+            self.client=httpx.AsyncClient(headers={'Accept-Encoding':'identity'},follow_redirects=True,timeout=httpx.Timeout(30,read=60))
+        return self.client
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+        self.client=None
+
+    def report(self,url:str,done:int,total:int|None):
+        finished=done==total and self.progress.get(url)!=(done,total)
+        self.progress[url]=(done,total)
+        now=perf_counter()
+        if self.on_progress is not None and (finished or now-self.reported.get(url,0)>=PROGRESS_INTERVAL):
+            self.reported[url]=now
+            self.on_progress(url,done,total)
+
+    async def download(self,url:str,path:Path)->DownloadResult:
+        async with self.semaphore:
+            start=perf_counter()
+            part=path.with_name(f'{path.name}.part')
+            state_path=part.with_name(f'{part.name}.json')
+            try:
+                size,ranges,validator=await self.probe(url)
+                state=await to_thread(self.read_state,state_path)
+                if validator is None or state.get('url')!=url or state.get('validator')!=validator:
+                    # A part of another url, or of an older version of the file, is started over
+                    await to_thread(part.unlink,missing_ok=True)
+                    state={}
+                state.update(url=url,validator=validator)
+                await to_thread(state_path.write_text,json.dumps(state))
+                if ranges and size is not None and size>=SEGMENT_THRESHOLD and self.segments>1:
+                    resumed=await self.download_segments(url,part,size,state,state_path)
+                    segments=self.segments
+                    digest=(await to_thread(hash_file,part)).hexdigest()
+                else:
+                    resumed,digest=await self.download_stream(url,part,ranges,validator)
+                    segments=1
+                await to_thread(replace,part,path)
+                await to_thread(state_path.unlink,missing_ok=True)
+            finally:
+                self.progress.pop(url,None)
+                self.reported.pop(url,None)
+            return DownloadResult(path=path,size=path.stat().st_size,duration=perf_counter()-start,sha256=digest,resumed=resumed,segments=segments)
+
+    async def probe(self,url:str)->tuple[int|None,bool,str|None]:
+        '''The size of the file, whether the server serves byte ranges and the validator of this version of the file'''
+        try:
+            response=await self.get_client().head(url)
+        except httpx.HTTPError:
+            return None,False,None
+        if response.status_code>=400:
+            return None,False,None
+        length=response.headers.get('content-length')
+        # A compressed transfer has no usable byte offsets
+        encoded=response.headers.get('content-encoding','identity')!='identity'
+        ranges=response.headers.get('accept-ranges','').lower()=='bytes' and not encoded
+        # If-Range takes a strong etag or a date, a weak etag cannot tell two versions apart byte for byte
+        etag=response.headers.get('etag')
+        validator=etag if etag and not etag.startswith('W/') else response.headers.get('last-modified')
+        return (int(length) if length and length.isdigit() else None),ranges,validator
+
+    def read_state(self,state_path:Path)->dict:
+        try:
+            return json.loads(state_path.read_text())
+        except (OSError,ValueError):
+            return {}
+
+    async def download_stream(self,url:str,part:Path,ranges:bool,validator:str|None)->tuple[bool,str]:
+        '''Single stream, appended to the partial file when the server resumes from its end'''
+        digest=sha256()
+        offset=part.stat().st_size if part.exists() and ranges and validator else 0
+        # With If-Range a changed file comes back whole with a 200 instead of its tail
+        headers={'Range':f'bytes={offset}-','If-Range':validator} if offset else {}
+        async with self.get_client().stream('GET',url,headers=headers) as response:
+            response.raise_for_status()
+            resumed=offset>0 and response.status_code==206
+            if resumed:
+                # The hash covers the whole file, so the part already on disk is hashed first
+                digest=await to_thread(hash_file,part)
+            else:
+                offset=0
+            total=response.headers.get('content-length')
+            total=offset+int(total) if total and total.isdigit() else None
+            done=offset
+            f=await to_thread(open,part,'ab' if resumed else 'wb')
+            try:
+                buffer=bytearray()
+                async for chunk in response.aiter_raw(CHUNK_SIZE) if ranges else response.aiter_bytes(CHUNK_SIZE):
+                    digest.update(chunk)
+                    buffer+=chunk
+                    done+=len(chunk)
+                    if len(buffer)>=CHUNK_SIZE:
+                        await to_thread(f.write,bytes(buffer))
+                        buffer.clear()
+                        self.report(url,done,total)
+                if buffer:
+                    await to_thread(f.write,bytes(buffer))
+            finally:
+                await to_thread(f.close)
+        self.report(url,done,total)
+        return resumed,digest.hexdigest()
+
+    async def download_segments(self,url:str,part:Path,size:int,state:dict,state_path:Path)->bool:
+        '''Parallel ranges written at their offsets, the state file keeps the bytes done per segment for the resume'''
+        length=-(-size//self.segments)
+        ranges=[(start,min(start+length,size)-1) for start in range(0,size,length)]
+        done=[0]*len(ranges)
+        if part.exists() and state.get('size')==size and len(state.get('done',[]))==len(ranges):
+            done=state.get('done')
+        resumed=any(done)
+        validator=state.get('validator')
+        save_state=lambda:state_path.write_text(json.dumps({**state,'size':size,'done':done}))
+        if not resumed:
+            await to_thread(self.allocate,part,size)
+
+        async def fetch(index:int):
+            start,end=ranges[index]
+            if start+done[index]>end:
+                return None
+            headers={'Range':f'bytes={start+done[index]}-{end}'}
+            if validator is not None:
+                headers['If-Range']=validator
+            async with self.get_client().stream('GET',url,headers=headers) as response:
+                if response.status_code!=206:
+                    # A 200 to If-Range means the file changed, the next probe sees the new validator and starts over
+                    raise Exception(f'Server ignored the range request ({response.status_code})')
+                f=await to_thread(open,part,'r+b')
+                try:
+                    await to_thread(f.seek,start+done[index])
+                    unsaved=0
+                    async for chunk in response.aiter_raw(CHUNK_SIZE):
+                        await to_thread(f.write,chunk)
+                        done[index]+=len(chunk)
+                        unsaved+=len(chunk)
+                        self.report(url,sum(done),size)
+                        # Saved after the writes, so a resume never skips bytes that are not on disk
+                        if unsaved>=8*CHUNK_SIZE:
+                            await to_thread(f.flush)
+                            await to_thread(save_state)
+                            unsaved=0
+                finally:
+                    await to_thread(f.close)
+                    await to_thread(save_state)
+
+        tasks=[create_task(fetch(index)) for index in range(len(ranges))]
+        try:
+            await gather(*tasks)
+        finally:
+            # A failed segment stops the others, so no writer is left on the part file once the download has raised
+            for task in tasks:
+                task.cancel()
+            await gather(*tasks,return_exceptions=True)
+        return resumed
+
+    def allocate(self,part:Path,size:int):
+        with open(part,'wb') as f:
+            f.truncate(size)
@@ -0,0 +1,76 @@
+from main_content_extractor import MainContentExtractor
+from src.agent.web.dom.serializer import estimate_tokens
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from asyncio import get_running_loop,to_thread
+from multiprocessing import get_context
+from collections import OrderedDict
+from functools import cache
+from hashlib import sha256
+from typing import Literal
+import atexit
+
+def extract_content(html:str,format:Literal['markdown','text'])->str:
+    return MainContentExtractor.extract(html=html,include_links=True,output_format=format)
+
+def split_chunks(content:str,chunk_tokens:int)->list[str]:
+    '''Split the content in chunks of about chunk_tokens, on paragraph then line boundaries'''
+    max_length=chunk_tokens*4
+    chunks,current=[],''
+    for paragraph in content.split('\n\n'):
+        pieces=[paragraph]
+        if len(paragraph)>max_length:
+            # A paragraph past the chunk size is cut on its lines, a line past it on its characters
+            pieces=[line[start:start+max_length] for line in paragraph.split('\n') for start in range(0,max(len(line),1),max_length)]
+        for index,piece in enumerate(pieces):
+            separator='\n\n' if index==0 else '\n'
+            if current and estimate_tokens(current+separator+piece)>chunk_tokens:
+                chunks.append(current)
+                current=piece
+            else:
+                current=f'{current}{separator}{piece}' if current else piece
+    if current or not chunks:
+        chunks.append(current)
+    return chunks
+
+class ContentExtractor:
+    '''Extracts the main content of the pages in worker processes, off the event loop, and keeps the recent results by the hash of the html.'''
+    def __init__(self,max_workers:int|None=2,cache_size:int=32):
+        self.max_workers=max_workers
+        self.cache_size=cache_size
+        self.executor:ProcessPoolExecutor=None
+        self.cache:OrderedDict[tuple[str,str],str]=OrderedDict()
+
+    def get_executor(self)->ProcessPoolExecutor:
+        if self.executor is None:
+            # Spawned, so no worker inherits the event loop or the playwright driver
+            self.executor=ProcessPoolExecutor(max_workers=self.max_workers,mp_context=get_context('spawn'))
+        return self.executor
+
+    async def extract(self,html:str,format:Literal['markdown','text']='markdown')->str:
+        key=(sha256(html.encode('utf-8','replace')).hexdigest(),format)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        try:
+            content=await get_running_loop().run_in_executor(self.get_executor(),extract_content,html,format)
+        except BrokenProcessPool:
+            # A worker died, the pool is rebuilt on the next call and this page is extracted in a thread
+            self.executor=None
+            content=await to_thread(extract_content,html,format)
+        self.cache[key]=content
+        while len(self.cache)>self.cache_size:
+            self.cache.popitem(last=False)
+        return content
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False,cancel_futures=True)
+        self.executor=None
+
+@cache
+def get_content_extractor()->ContentExtractor:
+    '''One extractor per process, its workers are shared by all the contexts and shut down when the process exits'''
+    extractor=ContentExtractor()
+    atexit.register(extractor.close)
+    return extractor
@@ -0,0 +1,184 @@
+from src.agent.web.extract import get_content_extractor
+from xml.etree import ElementTree
+from html import unescape
+from dataclasses import dataclass
+from urllib.parse import urlparse
+from typing import Literal
+from functools import cache
+from time import perf_counter,time
+import httpx
+import re
+
+HTML_TYPES = {'text/html','application/xhtml+xml'}
+FEED_TYPES = {'application/rss+xml','application/atom+xml','application/xml','text/xml'}
+TEXT_TYPES = {'text/plain','text/markdown','text/csv','application/json'}
+# Below this many characters of main content a page is taken as rendered by its scripts
+MIN_CONTENT_LENGTH = 200
+# A domain goes to the browser for good only after this many of its pages in a row needed it
+MIN_BROWSER_OUTCOMES = 2
+NOSCRIPT_PATTERN = re.compile(r'<noscript[^>]*>(.*?)</noscript>',re.IGNORECASE|re.DOTALL)
+NOSCRIPT_WALL_PATTERN = re.compile(r'(enable|turn on|requires?|need)\b.{0,40}javascript',re.IGNORECASE|re.DOTALL)
+TITLE_PATTERN = re.compile(r'<title[^>]*>(.*?)</title>',re.IGNORECASE|re.DOTALL)
+APP_ROOT_PATTERN = re.compile(r'<(div|main)[^>]+id=["\'](root|app|__next|__nuxt|svelte)["\'][^>]*>\s*</\1>|<app-root[^>]*>\s*</app-root>',re.IGNORECASE)
+
+@dataclass
+class FetchResult:
+    url:str
+    content_type:str
+    content:str
+    duration:float
+    title:str=''
+
+def sniff_content_type(content_type:str,head:bytes)->str:
+    '''The media type of the response, guessed from the first bytes when the server does not say'''
+    media_type=content_type.split(';')[0].strip().lower()
+    if media_type and media_type not in ('application/octet-stream','binary/octet-stream'):
+        return media_type
+    start=head.lstrip()[:256].lower()
+    if start.startswith((b'<!doctype html',b'<html')) or b'<head' in start or b'<body' in start:
+        return 'text/html'
+    if start.startswith(b'<?xml') or start.startswith((b'<rss',b'<feed')):
+        return 'application/xml'
+    if start.startswith((b'{',b'[')):
+        return 'application/json'
+    return media_type
+
+def is_script_rendered(html:str,content:str)->bool:
+    '''The page needs the browser: next to no content outside of the scripts, an empty app root or a noscript wall'''
+    text=content.strip()
+    if len(text)<MIN_CONTENT_LENGTH:
+        return True
+    if len(text)>=5*MIN_CONTENT_LENGTH:
+        return False
+    if APP_ROOT_PATTERN.search(html):
+        return True
+    return any(NOSCRIPT_WALL_PATTERN.search(block) for block in NOSCRIPT_PATTERN.findall(html))
+
+def format_feed(xml:str)->str|None:
+    '''The entries of an RSS or Atom feed as a markdown list, None when it is not a feed'''
+    try:
+        root=ElementTree.fromstring(xml)
+    except ElementTree.ParseError:
+        return None
+    # The Atom elements are namespaced, the local names are enough here
+    name=lambda element:element.tag.rsplit('}',1)[-1]
+    if name(root) not in ('rss','feed','RDF'):
+        return None
+    lines=[]
+    for item in root.iter():
+        if name(item) not in ('item','entry'):
+            continue
+        fields={name(child):child for child in item}
+        title=(fields.get('title').text or '').strip() if 'title' in fields else ''
+        link=fields.get('link')
+        link=(link.text or link.get('href','')).strip() if link is not None else ''
+        date=next(((fields.get(key).text or '').strip() for key in ('pubDate','published','updated','date') if key in fields),'')
+        lines.append(f'- [{title}]({link}) {date}'.strip())
+    return '\n'.join(lines)
+
+class DomainOutcomes:
+    '''Remembers the domains whose pages need the browser, so their later urls skip the HTTP probe.'''
+    def __init__(self,ttl:float|None=None,min_failures:int=MIN_BROWSER_OUTCOMES):
+        self.ttl=ttl
+        self.min_failures=min_failures
+        # Last outcome of the domain, how many times in a row it was seen and when
+        self.outcomes:dict[str,tuple[str,int,float]]={}
+
+    def get(self,host:str)->Literal['http','browser']|None:
+        outcome,count,timestamp=self.outcomes.get(host,(None,0,0))
+        if outcome is not None and self.ttl is not None and time()-timestamp>self.ttl:
+            self.outcomes.pop(host,None)
+            return None
+        # One short page (a stub, a soft 404) says little of the rest of the domain
+        if outcome=='browser' and count<self.min_failures:
+            return None
+        return outcome
+
+    def set(self,host:str,outcome:Literal['http','browser']):
+        previous,count,_=self.outcomes.get(host,(None,0,0))
+        self.outcomes[host]=(outcome,count+1 if previous==outcome else 1,time())
+
+@cache
+def get_domain_outcomes(ttl:float|None)->DomainOutcomes:
+    '''One table per process, shared by all the contexts'''
+    return DomainOutcomes(ttl)
+
+class Fetcher:
+    '''Fast path of the static pages: a plain HTTP GET and the content extraction, without rendering the page. None means the browser is needed.'''
+    def __init__(self,user_agent:str,timeout:float=10,max_size:int=5*1024*1024,ttl:float|None=None):
+        self.user_agent=user_agent
+        self.timeout=timeout
+        self.max_size=max_size
+        self.outcomes=get_domain_outcomes(ttl)
+        self.client:httpx.AsyncClient=None
+
+    def get_client(self)->httpx.AsyncClient:
+        if self.client is None or self.client.is_closed:
+            headers={'User-Agent':self.user_agent,'Accept':'text/html,application/xhtml+xml,application/xml;q=0.9,text/plain;q=0.8,*/*;q=0.5'}
+            self.client=httpx.AsyncClient(headers=headers,follow_redirects=True,timeout=self.timeout,limits=httpx.Limits(max_connections=20,max_keepalive_connections=10))
+        return self.client
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+        self.client=None
+
+    async def fetch(self,url:str,format:Literal['markdown','text']='markdown',cookie:str='')->FetchResult|None:
+        try:
+            host=urlparse(url).hostname or ''
+        except ValueError:
+            return None
+        if self.outcomes.get(host)=='browser':
+            return None
+        start=perf_counter()
+        try:
+            result,outcome=await self.get(url,format,cookie)
+        except Exception:
+            # Network trouble, a bad url or a page that fails to decode say nothing about the domain, the browser gets its own try
+            return None
+        if outcome is not None:
+            self.outcomes.set(host,outcome)
+        if result is not None:
+            result.duration=perf_counter()-start
+        return result
+
+    async def get(self,url:str,format:Literal['markdown','text'],cookie:str='')->tuple[FetchResult|None,Literal['http','browser']|None]:
+        '''The result and what it says of the domain, None for either when it says nothing'''
+        headers={'Cookie':cookie} if cookie else {}
+        async with self.get_client().stream('GET',url,headers=headers) as response:
+            # httpx drops the cookie header on a redirect, the page after it is not the one the session would see
+            if cookie and response.history:
+                return None,None
+            # Bot walls and challenges (403, 429, 503) are left to the browser
+            if response.status_code in (401,403,429,503):
+                return None,'browser'
+            if response.status_code!=200:
+                return None,None
+            length=response.headers.get('content-length')
+            if length and length.isdigit() and int(length)>self.max_size:
+                return None,None
+            body=bytearray()
+            async for chunk in response.aiter_bytes():
+                body+=chunk
+                if len(body)>self.max_size:
+                    return None,None
+            content_type=sniff_content_type(response.headers.get('content-type',''),bytes(body[:512]))
+            text=bytes(body).decode(response.encoding or 'utf-8',errors='replace')
+            final_url=str(response.url)
+        title=''
+        if content_type in HTML_TYPES:
+            content=await get_content_extractor().extract(html=text,format=format)
+            if is_script_rendered(text,content):
+                return None,'browser'
+            match=TITLE_PATTERN.search(text)
+            title=unescape(match.group(1)).strip() if match else ''
+        elif content_type in FEED_TYPES:
+            content=format_feed(text)
+            if content is None:
+                return None,None
+        elif content_type in TEXT_TYPES:
+            content=text
+        else:
+            # Documents, media and the rest are for the download tool or the browser
+            return None,None
+        return FetchResult(url=final_url,content_type=content_type,content=content,duration=0.0,title=title),'http'
@@ -0,0 +1,88 @@
+from src.agent.web.browser.config import BrowserConfig,PoolConfig
+from src.agent.web.browser.pool import BrowserPool
+from src.agent.web.context import ContextConfig
+from src.agent.web import WebAgent
+from typing import Callable,Iterable,TextIO,Any
+from asyncio import Queue,gather,wait_for,to_thread,TimeoutError
+from time import perf_counter
+from pathlib import Path
+import json
+
+def read_tasks(path:str)->list[dict]:
+    '''Read the tasks of a JSONL file, each line has the task under "input" and optionally an "id" and a "timeout" in seconds'''
+    tasks=[]
+    with open(path) as f:
+        for index,line in enumerate(f):
+            line=line.strip()
+            if not line:
+                continue
+            task=json.loads(line)
+            task.setdefault('id',index)
+            tasks.append(task)
+    return tasks
+
+class TaskRunner:
+    '''Runs a batch of tasks concurrently, each one in its own context of a shared browser, and streams the results as JSONL.'''
+    def __init__(self,agent_factory:Callable[[BrowserPool],WebAgent],config:BrowserConfig=None,context_config:ContextConfig=None,concurrency:int=4,timeout:float|None=None):
+        self.agent_factory=agent_factory
+        self.concurrency=concurrency
+        self.timeout=timeout
+        # A single browser, every task gets an isolated context of it
+        pool_config=PoolConfig(size=1,contexts_per_browser=concurrency)
+        self.pool=BrowserPool(config=config,pool_config=pool_config,context_config=context_config)
+        self.metrics={'completed':0,'timeout':0,'error':0}
+
+    async def run_task(self,agent:WebAgent,task:dict)->dict:
+        timeout=task.get('timeout',self.timeout)
+        start=perf_counter()
+        result={'id':task.get('id'),'input':task.get('input')}
+        try:
+            response=await wait_for(agent.async_invoke(task.get('input')),timeout=timeout)
+            output=response.get('output')
+            result|={'status':'completed','output':output.model_dump() if hasattr(output,'model_dump') else output}
+        except TimeoutError:
+            # Cancelling the agent releases its context back to the pool
+            result|={'status':'timeout','output':None}
+        except Exception as e:
+            result|={'status':'error','output':None,'error':str(e)}
+        result|={'steps':agent.iteration,'duration':perf_counter()-start}
+        self.metrics[result.get('status')]+=1
+        return result
+
+    async def worker(self,queue:Queue,output:TextIO):
+        # One agent per worker, an agent runs a single task at a time
+        agent=self.agent_factory(self.pool)
+        while not queue.empty():
+            task=queue.get_nowait()
+            result=await self.run_task(agent,task)
+            output.write(json.dumps(result,default=str)+'\n')
+            output.flush()
+
+    async def run(self,tasks:Iterable[dict],output:TextIO)->dict:
+        '''Run the tasks with at most concurrency of them at once, each result is written as soon as its task ends'''
+        queue=Queue()
+        for task in tasks:
+            queue.put_nowait(task)
+        start=perf_counter()
+        async with self.pool:
+            await gather(*[self.worker(queue,output) for _ in range(min(self.concurrency,queue.qsize()))])
+        return self.metrics|{'duration':perf_counter()-start}
+
+    async def serve(self,tasks:Any,results:Any,worker_id:int=0)->dict:
+        '''Run the tasks of a process queue until the stop sentinel (None), the results are put on the results queue'''
+        async def consume():
+            agent=self.agent_factory(self.pool)
+            # The blocking get runs in a thread, the loop keeps driving the other agents
+            while (task:=await to_thread(tasks.get)) is not None:
+                result=await self.run_task(agent,task)
+                results.put({'type':'result','worker':worker_id}|result)
+        start=perf_counter()
+        async with self.pool:
+            await gather(*[consume() for _ in range(self.concurrency)])
+        return self.metrics|{'duration':perf_counter()-start}
+
+    async def run_file(self,input_path:str,output_path:str)->dict:
+        tasks=read_tasks(input_path)
+        Path(output_path).parent.mkdir(parents=True,exist_ok=True)
+        with open(output_path,'a') as output:
+            return await self.run(tasks,output)
@@ -1,16 +1,16 @@
 # src/agent/web/tools/__init__.py
-from src.agent.web.tools.views import Click,Type,Wait,Scroll,GoTo,Back,Key,Download,Scrape,Tab,Upload,Menu,Done,Forward, HumanInput # Import HumanInput
-from main_content_extractor import MainContentExtractor
+from src.agent.web.tools.views import Click,Type,Wait,Scroll,GoTo,Back,Key,Download,Scrape,Fetch,Crawl,Tab,Upload,Menu,Done,Forward, HumanInput # Import HumanInput
+from src.agent.web.extract import get_content_extractor,split_chunks
 #from youtube_transcript_api import YouTubeTranscriptApi
-from urllib.parse import urlparse, parse_qs
+from urllib.parse import urlparse, parse_qs, urldefrag
+from asyncio import Semaphore,gather
+from time import perf_counter
 from src.agent.web.context import Context
 from typing import Literal,Optional
 from termcolor import colored # Import colored for better output
 from src.tool import Tool
-from asyncio import sleep
 from pathlib import Path
 from os import getcwd
-import httpx
 
 @Tool('Done Tool',params=Done)
 async def done_tool(content:str,context:Context=None):
@@ -23,7 +23,7 @@ async def click_tool(index:int,context:Context=None):
     page=await context.get_current_page()
     await page.wait_for_load_state('load')
     element=await context.get_element_by_index(index=index)
-    handle=await context.get_handle_by_xpath(element.xpath)
+    handle=await context.get_handle(element)
     is_hidden=await handle.is_hidden()
     if not is_hidden:
         await handle.scroll_into_view_if_needed()
@@ -31,27 +31,49 @@ async def click_tool(index:int,context:Context=None):
     return f'Clicked on the element at label {index}'
 
 @Tool('Type Tool',params=Type)
-async def type_tool(index:int,text:str,clear:Literal['True','False']='False',context:Context=None):
+async def type_tool(index:int,text:str,clear:Literal['True','False']='False',strategy:Literal['auto','fill','type']='auto',context:Context=None):
     '''To type text into input fields, search boxes'''
     page=await context.get_current_page()
     element=await context.get_element_by_index(index=index)
-    handle=await context.get_handle_by_xpath(element.xpath)
+    handle=await context.get_handle(element)
     await page.wait_for_load_state('load')
     is_hidden=await handle.is_hidden()
     if not is_hidden:
         await handle.scroll_into_view_if_needed()
+    if strategy=='auto':
+        # Keystrokes only for the fields that need the key events (autocomplete, masks, rich text)
+        try:
+            strategy=await handle.evaluate('element=>getTypingStrategy(element)')
+        except Exception:
+            strategy='type'
+    if strategy=='fill':
+        try:
+            value='' if clear=='True' else await handle.input_value()
+            await handle.fill(value+text)
+            return f'Typed {text} in element at label {index}'
+        except Exception:
+            # Not a fillable field after all
+            pass
     await handle.click(force=True)
     if clear=='True':
-        await page.keyboard.press('Control+A')
-        await page.keyboard.press('Backspace')
-    await page.keyboard.type(text,delay=80)
+        try:
+            await handle.fill('')
+        except Exception:
+            await page.keyboard.press('Control+A')
+            await page.keyboard.press('Backspace')
+    await page.keyboard.type(text,delay=context.config.typing_delay)
     return f'Typed {text} in element at label {index}'
 
 @Tool('Wait Tool',params=Wait)
 async def wait_tool(time:int,context:Context=None):
     '''To wait until the page has fully loaded before proceeding'''
-    await sleep(time)
-    return f'Waited for {time}s'
+    # Returns as soon as the page is ready, the time is only the upper bound
+    start=perf_counter()
+    ready=await context.wait_for_ready(timeout=time)
+    elapsed=perf_counter()-start
+    if all(ready.values()):
+        return f'Waited {elapsed:.1f}s until the page was ready'
+    return f'Waited for {time}s, the page is still busy ({", ".join(key for key,value in ready.items() if not value)})'
 
 @Tool('Scroll Tool',params=Scroll)
 async def scroll_tool(direction:Literal['up','down']='up',amount:int=None,context:Context=None):
@@ -137,23 +159,93 @@ async def key_tool(keys:str,times:int=1,context:Context=None):
 @Tool('Download Tool',params=Download)
 async def download_tool(url:str=None,filename:str=None,context:Context=None):
     '''To download a file (e.g., pdf, image, video, audio) to the system'''
-    folder_path=Path(context.browser.config.downloads_dir)
-    async with httpx.AsyncClient() as client:
-        response=await client.get(url)
+    folder_path=Path(context.browser.config.downloads_dir or Path(getcwd()).joinpath('./downloads'))
+    folder_path.mkdir(parents=True,exist_ok=True)
     path=folder_path.joinpath(filename)
-    with open(path,'wb') as f:
-        async for chunk in response.aiter_bytes():
-            f.write(chunk)
-    return f'Downloaded {filename} from {url} and saved it to {path}'
+    # Streamed to disk off the event loop, an interrupted download resumes from its partial file
+    result=await context.downloads.download(url,path)
+    return f'Downloaded {filename} from {url} and saved it to {path}: {result.to_string()}'
+
+def paginate(content:str,page:int,chunk_tokens:int)->str:
+    '''The requested page of the content when it is past the chunk size'''
+    chunks=split_chunks(content,chunk_tokens)
+    if len(chunks)==1:
+        return content
+    if not 1<=page<=len(chunks):
+        return f'The content has {len(chunks)} pages, page {page} does not exist.'
+    note=f'\nCall again with page={page+1} for the next page.' if page<len(chunks) else ''
+    return f'Page {page} of {len(chunks)}:\n{chunks[page-1]}{note}'
 
 @Tool('Scrape Tool',params=Scrape)
-async def scrape_tool(format:Literal['markdown','text']='markdown',context:Context=None):
-    '''Scrape the contents of the entire webpage'''
-    page=await context.get_current_page()
-    await page.wait_for_load_state('domcontentloaded')
-    html=await page.content()
-    content=MainContentExtractor.extract(html=html,include_links=True,output_format=format)
-    return f'Scraped the contents of the entire webpage:\n{content}'
+async def scrape_tool(format:Literal['markdown','text']='markdown',page:int=1,context:Context=None):
+    '''Scrape the contents of the entire webpage, the long ones come in numbered pages'''
+    current_page=await context.get_current_page()
+    await current_page.wait_for_load_state('domcontentloaded')
+    html=await current_page.content()
+    content=await get_content_extractor().extract(html=html,format=format)
+    return f'Scraped the contents of the entire webpage:\n{paginate(content,page,context.config.scrape_chunk_tokens)}'
+
+@Tool('Fetch Tool',params=Fetch)
+async def fetch_tool(url:str,format:Literal['markdown','text']='markdown',page:int=1,context:Context=None):
+    '''To read the contents of a webpage by its URL, the static pages are fetched without the browser and the others are opened in the current tab'''
+    result=await context.fast_fetch(url,format)
+    if result is not None:
+        return f'Fetched {result.url} without the browser ({result.content_type}, {result.duration*1000:.0f}ms):\n{paginate(result.content,page,context.config.scrape_chunk_tokens)}'
+    current_page=await context.get_current_page()
+    # The next pages of a long webpage are read from the tab already on it
+    if urldefrag(current_page.url).url!=urldefrag(url).url:
+        await current_page.goto(url=url,wait_until='domcontentloaded')
+        await context.wait_for_ready()
+    html=await current_page.content()
+    content=await get_content_extractor().extract(html=html,format=format)
+    return f'Navigated to {url} and scraped its contents:\n{paginate(content,page,context.config.scrape_chunk_tokens)}'
+
+@Tool('Crawl Tool',params=Crawl)
+async def crawl_tool(urls:list[str],format:Literal['markdown','text']='markdown',context:Context=None):
+    '''To read several webpages at once (e.g., the results of a search), each one is fetched or opened in a background tab and its main content returned'''
+    session=await context.get_session()
+    # Deduplicated in order, the fragment of a url points into the same page
+    urls=list(dict.fromkeys(urldefrag(url.strip()).url for url in urls if url.strip()))
+    semaphore=Semaphore(context.config.crawl_concurrency)
+
+    async def crawl(url:str)->str:
+        if urlparse(url).scheme not in ('http','https'):
+            return f'## {url}\nSkipped: not a webpage url.'
+        if url in context.visited:
+            return f'## {url}\nSkipped: already crawled, its content is in an earlier observation.'
+        async with semaphore:
+            # The static pages skip the tab, only the ones rendered by their scripts need it
+            try:
+                result=await context.fast_fetch(url,format)
+            except Exception:
+                # One bad url must not fail the whole crawl, the browser gets its own try
+                result=None
+            if result is not None:
+                title,content,final_url=result.title,result.content,result.url
+            else:
+                page=await session.context.new_page()
+                try:
+                    await page.goto(url,wait_until='domcontentloaded')
+                    await context.wait_for_network_idle(page,timeout=context.config.maximum_wait_page_load_time)
+                    title,html,final_url=await page.title(),await page.content(),page.url
+                except Exception as e:
+                    return f'## {url}\nFailed: {e}'
+                finally:
+                    await page.close()
+                try:
+                    content=await get_content_extractor().extract(html=html,format=format)
+                except Exception as e:
+                    return f'## {url}\nFailed to extract the content: {e}'
+        # Only a page actually read counts as crawled, under its url and the one it redirected to
+        context.visited.update({url,urldefrag(final_url).url})
+        chunks=split_chunks(content,context.config.crawl_page_tokens)
+        note=f'\n[{len(chunks)-1} more pages, fetch the url for the full content]' if len(chunks)>1 else ''
+        return f'## {title or url}\nURL: {url}\n{chunks[0]}{note}'
+
+    results=await gather(*[crawl(url) for url in urls])
+    # The background tabs may have taken the focus in a headed browser
+    await session.current_page.bring_to_front()
+    return f'Crawled {len(urls)} webpages:\n\n'+'\n\n'.join(results)
 
 @Tool('Tab Tool', params=Tab)
 async def tab_tool(mode: Literal['open', 'close', 'switch'], tab_index: Optional[int] = None, context: Context = None):
@@ -190,7 +282,7 @@ async def tab_tool(mode: Literal['open', 'close', 'switch'], tab_index: Optional
 async def upload_tool(index:int,filenames:list[str],context:Context=None):
     '''To upload files to an element in the webpage'''
     element=await context.get_element_by_index(index=index)
-    handle=await context.get_handle_by_xpath(element.xpath)
+    handle=await context.get_handle(element)
     files=[Path(getcwd()).joinpath('./uploads',filename) for filename in filenames]
     page=await context.get_current_page()
     async with page.expect_file_chooser() as file_chooser_info:
@@ -208,7 +300,7 @@ async def upload_tool(index:int,filenames:list[str],context:Context=None):
 async def menu_tool(index:int,labels:list[str],context:Context=None):
     '''To interact with an element having dropdown menu and select an option from it'''
     element=await context.get_element_by_index(index=index)
-    handle=await context.get_handle_by_xpath(element.xpath)
+    handle=await context.get_handle(element)
     labels=labels if len(labels)>1 else labels[0]
     await handle.select_option(label=labels)
     return f'Opened context menu of element at label {index} and selected {', '.join(labels)}'
@@ -15,6 +15,7 @@ class Type(SharedBaseModel):
     index:int = Field(...,description="the index of the element to type in the text",examples=[0])
     text:str = Field(...,description="the text to type",examples=["hello world"])
     clear:Literal['True','False']=Field(description="whether to clear the text before typing",default="False",examples=['True'])
+    strategy:Literal['auto','fill','type']=Field(description="how to enter the text: fill sets it at once, type presses each key (for autocomplete or masked fields), auto picks from the element",default='auto',examples=['type'])
 
 class Wait(SharedBaseModel):
     time:int = Field(...,description="the time to wait for the element to be visible in seconds",examples=[1])
@@ -46,6 +47,16 @@ class Download(SharedBaseModel):
 
 class Scrape(SharedBaseModel):
     format:Literal['markdown','text'] = Field(description="the format of content to be like",examples=['text'],default='markdown')
+    page:int = Field(description="the page of the content to return, the long webpages are split in numbered pages",examples=[2],default=1)
+
+class Fetch(SharedBaseModel):
+    url:str = Field(...,description="the url of the webpage to read",examples=["https://docs.python.org/3/library/asyncio.html"])
+    format:Literal['markdown','text'] = Field(description="the format of content to be like",examples=['text'],default='markdown')
+    page:int = Field(description="the page of the content to return, the long webpages are split in numbered pages",examples=[2],default=1)
+
+class Crawl(SharedBaseModel):
+    urls:list[str] = Field(...,description="the urls of the webpages to read at once",examples=[["https://www.example.com","https://www.example.org/about"]])
+    format:Literal['markdown','text'] = Field(description="the format of content to be like",examples=['text'],default='markdown')
 
 class Tab(SharedBaseModel):
     mode:Literal['open','close','switch'] = Field(...,description="the mode of the tab",examples=['open'])
@@ -0,0 +1,75 @@
+from src.agent.web.browser.config import BrowserConfig
+from src.agent.web.browser.pool import BrowserPool
+from src.agent.web.context import ContextConfig
+from src.agent.web.runner import TaskRunner,read_tasks
+from src.agent.web import WebAgent
+from multiprocessing import get_context,cpu_count
+from typing import Callable,Iterable,TextIO
+from time import perf_counter
+from pathlib import Path
+from queue import Empty
+from os import getpid
+import asyncio
+import json
+
+def worker_main(worker_id:int,agent_factory:Callable[[BrowserPool],WebAgent],tasks,results,options:dict):
+    '''Entry point of a worker process: its own event loop, browser and runner'''
+    runner=TaskRunner(agent_factory=agent_factory,**options)
+    try:
+        metrics=asyncio.run(runner.serve(tasks,results,worker_id=worker_id))
+    except Exception as e:
+        print(f'Worker {worker_id} failed: {e}')
+        metrics=runner.metrics|{'failure':str(e)}
+    results.put({'type':'metrics','worker':worker_id,'pid':getpid()}|metrics)
+
+class Supervisor:
+    '''Spreads a batch of tasks over worker processes, each one runs the tasks concurrently in its own browser. The agent factory is sent to the workers, so it must be a module level function.'''
+    def __init__(self,agent_factory:Callable[[BrowserPool],WebAgent],workers:int|None=None,concurrency:int=2,config:BrowserConfig=None,context_config:ContextConfig=None,timeout:float|None=None):
+        self.agent_factory=agent_factory
+        self.workers=workers or cpu_count()
+        self.concurrency=concurrency
+        self.options={'config':config,'context_config':context_config,'concurrency':concurrency,'timeout':timeout}
+
+    def run(self,tasks:Iterable[dict],output:TextIO)->dict:
+        '''Run the tasks in the worker processes, each result is written as soon as it comes back'''
+        # Spawned, so no worker inherits the event loop or the playwright driver of the parent
+        context=get_context('spawn')
+        task_queue,result_queue=context.Queue(),context.Queue()
+        count=0
+        for task in tasks:
+            task_queue.put(task)
+            count+=1
+        workers=max(1,min(self.workers,count))
+        # One stop sentinel per agent of every worker
+        for _ in range(workers*self.concurrency):
+            task_queue.put(None)
+        start=perf_counter()
+        processes=[context.Process(target=worker_main,args=(worker_id,self.agent_factory,task_queue,result_queue,self.options)) for worker_id in range(workers)]
+        for process in processes:
+            process.start()
+        metrics={'completed':0,'timeout':0,'error':0,'workers':[]}
+        finished=0
+        while finished<workers:
+            try:
+                message=result_queue.get(timeout=1)
+            except Empty:
+                # A worker that died never reports its metrics
+                if not any(process.is_alive() for process in processes) and result_queue.empty():
+                    break
+                continue
+            if message.pop('type')=='metrics':
+                metrics['workers'].append(message)
+                finished+=1
+                continue
+            metrics[message.get('status')]+=1
+            output.write(json.dumps(message,default=str)+'\n')
+            output.flush()
+        for process in processes:
+            process.join()
+        return metrics|{'duration':perf_counter()-start}
+
+    def run_file(self,input_path:str,output_path:str)->dict:
+        tasks=read_tasks(input_path)
+        Path(output_path).parent.mkdir(parents=True,exist_ok=True)
+        with open(output_path,'a') as output:
+            return self.run(tasks,output)
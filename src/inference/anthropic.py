@@ -44,7 +44,7 @@ class ChatAnthropic(BaseInference):
                                 'type':'image',
                                 'source':{
                                     'type':'base64',
-                                    'media_type':'image/png',
+                                    'media_type':message.mime_type,
                                     'data':image
                                 }
                             }
@@ -135,7 +135,7 @@ class ChatAnthropic(BaseInference):
                                 'type': 'image',
                                 'source': {
                                     'type': 'base64',
-                                    'media_type': 'image/png',
+                                    'media_type': message.mime_type,
                                     'data': image
                                 }
                             }
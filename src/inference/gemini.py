@@ -49,7 +49,7 @@ class ChatGemini(BaseInference):
                     },
                     {
                         'inline_data':{
-                            'mime_type':'image/jpeg',
+                            'mime_type':message.mime_type,
                             'data': image
                         }
                     }]
@@ -149,7 +149,7 @@ class ChatGemini(BaseInference):
                     },
                     {
                         'inline_data':{
-                            'mime_type':'image/jpeg',
+                            'mime_type':message.mime_type,
                             'data': image
                         }
                     }]
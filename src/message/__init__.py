@@ -31,8 +31,9 @@ class SystemMessage(BaseMessage):
         self.content=content
 
 class ImageMessage(BaseMessage):
-    def __init__(self,text:str=None,image_path:str=None,image_obj:str=None):
+    def __init__(self,text:str=None,image_path:str=None,image_obj:str=None,mime_type:str='image/jpeg'):
         self.role='user'
+        self.mime_type=mime_type
         if image_obj is not None or image_path is None:
             self.content=(text,self.__encoder(image_obj))
         elif image_path is not None or image_obj is None: